@@ -1,38 +1,85 @@
 import asyncio
 import logging
-from datetime import datetime
-from typing import Optional
+import queue
+import time
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Tuple
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, CommandObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup,
     InlineKeyboardButton, ReplyKeyboardRemove
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
+from cachetools import TTLCache
 
 from config import Config
 from database import Database
 from games import GameEngine
+from middlewares import DedupMiddleware, RateLimitMiddleware, RequestCacheMiddleware, request_users
+from session import PreserializedSession
+from storage import TTLMemoryStorage
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+class _RawQueueHandler(QueueHandler):
+    """QueueHandler без форматирования: запись передается слушателю как есть"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Очередь в том же процессе, сериализация записи не нужна
+        return record
+
+# Настройка логирования: форматирование и запись в поток вывода выполняются
+# один раз, в фоновом потоке QueueListener
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_listener = QueueListener(_log_queue, _log_handler)
+logging.basicConfig(level=logging.INFO, handlers=[_RawQueueHandler(_log_queue)])
+_log_listener.start()
 logger = logging.getLogger(__name__)
 
 # Проверяем настройки
 Config.validate()
 
+# Настройки, которые читаются в обработчиках
+_ADMIN_ID = Config.ADMIN_ID
+_CLICK_COOLDOWN = Config.CLICK_COOLDOWN
+_CLICK_REWARD = Config.CLICK_REWARD
+_CLICK_REFERRAL_SHARE = Config.CLICK_REFERRAL_PERCENT / 100
+_MIN_BET_FLIP = Config.MIN_BETS['flip']
+_MIN_BET_DICE = Config.MIN_BETS['dice']
+
 # Инициализация бота и БД
-bot = Bot(token=Config.BOT_TOKEN)
-storage = MemoryStorage()
+session = PreserializedSession(limit=Config.TELEGRAM_POOL_LIMIT, timeout=Config.TELEGRAM_TIMEOUT)
+session._connector_init.update(
+    limit_per_host=Config.TELEGRAM_POOL_LIMIT_PER_HOST,
+    ttl_dns_cache=300,
+    keepalive_timeout=75
+)
+session.middleware(RateLimitMiddleware(
+    Config.TELEGRAM_RATE_LIMIT,
+    Config.TELEGRAM_CHAT_RATE_LIMIT,
+    max_chats=Config.CACHE_MAX_USERS
+))
+bot = Bot(token=Config.BOT_TOKEN, session=session)
+storage = TTLMemoryStorage(maxsize=Config.FSM_MAX_STATES, ttl=Config.FSM_STATE_TTL)
 dp = Dispatcher(storage=storage)
+dp.update.outer_middleware(RequestCacheMiddleware())
+dp.callback_query.outer_middleware(DedupMiddleware())
 db = Database()
 
+# Атомарный кулдаун клика, общий для всех процессов бота
+if Config.REDIS_URL:
+    from redis.asyncio import Redis
+    redis = Redis.from_url(Config.REDIS_URL)
+else:
+    redis = None
+
 # Состояния для FSM
 class GameStates(StatesGroup):
     choosing_game = State()
@@ -47,46 +94,385 @@ class AdminStates(StatesGroup):
     adding_sponsor = State()
     broadcasting = State()
 
+# ========== КЛАВИАТУРЫ ==========
+# Статичные клавиатуры собираются один раз при импорте
+
+_MAIN_MENU_ROWS = [
+    [InlineKeyboardButton(text="🐵 Заработать звезды", callback_data="earn")],
+    [InlineKeyboardButton(text="🎮 Играть в игры", callback_data="play_games")],
+    [InlineKeyboardButton(text="📊 Профиль", callback_data="profile")],
+    [InlineKeyboardButton(text="👥 Реферальная система", callback_data="referral")],
+]
+_ADMIN_MENU_ROW = [InlineKeyboardButton(text="👑 Админ панель", callback_data="admin_panel")]
+
+_MAIN_MENU_KB_USER = InlineKeyboardMarkup(inline_keyboard=_MAIN_MENU_ROWS)
+_MAIN_MENU_KB_ADMIN = InlineKeyboardMarkup(inline_keyboard=_MAIN_MENU_ROWS + [_ADMIN_MENU_ROW])
+
+_EARN_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎯 Кликнуть (+0.2 STAR)", callback_data="click")],
+    [InlineKeyboardButton(text="💸 Вывод средств", callback_data="withdraw_menu")],
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
+])
+
+_GAMES_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=Config.GAMES['flip']['name'], callback_data="game_flip")],
+    [InlineKeyboardButton(text=Config.GAMES['crash']['name'], callback_data="game_crash")],
+    [InlineKeyboardButton(text=Config.GAMES['slot']['name'], callback_data="game_slot")],
+    [InlineKeyboardButton(text=Config.GAMES['dice']['name'], callback_data="game_dice")],
+    [InlineKeyboardButton(text=Config.GAMES['jackpot']['name'], callback_data="game_jackpot")],
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
+])
+
+_FLIP_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🍌 Banana", callback_data="flip_heads")],
+    [InlineKeyboardButton(text="🐵 Monkey", callback_data="flip_tails")],
+    [InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")]
+])
+
+_CRASH_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🚀 Играть (ставка 1 STAR)", callback_data="crash_play_1")],
+    [InlineKeyboardButton(text="🚀 Играть (ставка 5 STAR)", callback_data="crash_play_5")],
+    [InlineKeyboardButton(text="🚀 Играть (ставка 10 STAR)", callback_data="crash_play_10")],
+    [InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")]
+])
+
+_SLOT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎰 Крутить (1 STAR)", callback_data="slot_play_1")],
+    [InlineKeyboardButton(text="🎰 Крутить (5 STAR)", callback_data="slot_play_5")],
+    [InlineKeyboardButton(text="🎰 Крутить (10 STAR)", callback_data="slot_play_10")],
+    [InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")]
+])
+
+# Числа 1-6 и кнопка назад
+_DICE_KB = InlineKeyboardMarkup(inline_keyboard=[
+    *([InlineKeyboardButton(text=f"🎲 {i}", callback_data=f"dice_{i}")] for i in range(1, 7)),
+    [InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")]
+])
+
+_JACKPOT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="💰 Купить билет (1 STAR)", callback_data="jackpot_play_1")],
+    [InlineKeyboardButton(text="💰 Купить 5 билетов (5 STAR)", callback_data="jackpot_play_5")],
+    [InlineKeyboardButton(text="💰 Купить 10 билетов (10 STAR)", callback_data="jackpot_play_10")],
+    [InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")]
+])
+
+_WITHDRAW_KB = InlineKeyboardMarkup(inline_keyboard=[
+    *([InlineKeyboardButton(text=f"{amount} STAR", callback_data=f"withdraw_{amount}")]
+      for amount in Config.WITHDRAWAL_AMOUNTS),
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="earn")]
+])
+
+_BACK_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
+])
+
+_ADMIN_PANEL_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
+    [InlineKeyboardButton(text="👥 Пользователи", callback_data="admin_users")],
+    [InlineKeyboardButton(text="📢 Добавить спонсора", callback_data="admin_add_sponsor")],
+    [InlineKeyboardButton(text="📢 Рассылка", callback_data="admin_broadcast")],
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
+])
+
+_BACK_TO_ADMIN_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="◀️ В админ панель", callback_data="admin_panel")]
+])
+
+# Клавиатуры после игры: повтор игры + общие строки
+_GAME_RESULT_ROWS = [
+    [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
+    [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")],
+]
+
+_FLIP_RESULT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎯 Играть снова", callback_data="game_flip")],
+    *_GAME_RESULT_ROWS
+])
+
+_CRASH_RESULT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🚀 Играть снова", callback_data="game_crash")],
+    *_GAME_RESULT_ROWS
+])
+
+_SLOT_RESULT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎰 Крутить снова", callback_data="game_slot")],
+    *_GAME_RESULT_ROWS
+])
+
+_DICE_RESULT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎲 Играть снова", callback_data="game_dice")],
+    *_GAME_RESULT_ROWS
+])
+
+_JACKPOT_RESULT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="💰 Купить билеты", callback_data="game_jackpot")],
+    *_GAME_RESULT_ROWS
+])
+
+_FLIP_CANCEL_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="◀️ Отмена", callback_data="game_flip")]
+])
+
+_DICE_CANCEL_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="◀️ Отмена", callback_data="game_dice")]
+])
+
+# JSON статичных клавиатур считается один раз, а не при каждой отправке
+for _kb in (_MAIN_MENU_KB_USER, _MAIN_MENU_KB_ADMIN, _EARN_KB, _GAMES_KB, _FLIP_KB,
+            _CRASH_KB, _SLOT_KB, _DICE_KB, _JACKPOT_KB, _WITHDRAW_KB,
+            _BACK_KB, _ADMIN_PANEL_KB, _BACK_TO_ADMIN_KB,
+            _FLIP_RESULT_KB, _CRASH_RESULT_KB, _SLOT_RESULT_KB, _DICE_RESULT_KB, _JACKPOT_RESULT_KB,
+            _FLIP_CANCEL_KB, _DICE_CANCEL_KB):
+    session.freeze(_kb)
+
+# ========== ТЕКСТЫ ==========
+# Шаблоны сообщений; полностью статичные тексты хранятся готовыми строками
+
+_MAIN_MENU_TMPL = (
+    "🐵 *Monkey Stars*\n\n"
+    "💰 Баланс: *{balance} STAR*\n\n"
+    "Выберите действие:"
+)
+
+_SPONSORS_TEXT = (
+    "📢 *Чтобы начать, подпишитесь на наших спонсоров!*\n\n"
+    "После подписки нажмите кнопку ниже:"
+)
+
+_EARN_TEXT = (
+    "🐵 *Заработать звезды*\n\n"
+    "Выберите способ заработка:"
+)
+
+_CLICK_TMPL = (
+    "✅ *Вы получили {reward} STAR!*\n\n"
+    "💰 Баланс: *{balance} STAR*\n\n"
+    "⏰ Следующий клик через 1 час"
+)
+
+_GAMES_TEXT = (
+    "🎮 *Выберите игру:*\n\n"
+    "💎 *Monkey Flip* - Подбрось банан и угадай сторону\n"
+    "🚀 *Banana Crash* - Забери деньги до краша\n"
+    "🎰 *Банановый слот* - Крути барабаны\n"
+    "🎲 *Банановые кости* - Угадай число\n"
+    "💰 *Джекпот* - Выиграй x100"
+)
+
+_FLIP_TMPL = (
+    "🎯 *Monkey Flip*\n\n"
+    "💰 Ваш баланс: *{balance} STAR*\n"
+    "📈 Шанс выигрыша: *49%*\n"
+    "🎲 Множитель: *x2.0*\n\n"
+    "Выберите сторону:"
+)
+
+_FLIP_BET_TMPL = (
+    "🎯 Вы выбрали: {side}\n\n"
+    "💰 Введите сумму ставки (минимум {min_bet} STAR):"
+)
+
+_FLIP_RESULT_TMPL = (
+    "🎯 *Monkey Flip*\n\n"
+    "{result}\n\n"
+    "💰 Новый баланс: *{balance} STAR*\n\n"
+    "🎮 Сыграть ещё?"
+)
+
+_CRASH_TMPL = (
+    "🚀 *Banana Crash*\n\n"
+    "💰 Ваш баланс: *{balance} STAR*\n"
+    "📈 Множитель растет от x1.00\n"
+    "💥 60% шанс мгновенного краша\n"
+    "🎰 2% шанс на высокий множитель\n\n"
+    "Выберите ставку:"
+)
+
+_CRASH_RESULT_TMPL = (
+    "🚀 *Banana Crash*\n\n"
+    "💰 Ставка: *{bet} STAR*\n"
+    "{result}\n\n"
+    "💰 Новый баланс: *{balance} STAR*\n\n"
+    "🎮 Сыграть ещё?"
+)
+
+_SLOT_TMPL = (
+    "🎰 *Банановый слот*\n\n"
+    "💰 Ваш баланс: *{balance} STAR*\n"
+    "🎯 3 одинаковых символа = x20\n"
+    "🍌 3 банана = ДЖЕКПОТ x50!\n"
+    "📊 Шанс выигрыша: 1/27\n\n"
+    "Выберите ставку:"
+)
+
+_SLOT_RESULT_TMPL = (
+    "🎰 *Банановый слот*\n\n"
+    "💰 Ставка: *{bet} STAR*\n"
+    "🎰 Результат: *{reels}*\n"
+    "{result}\n\n"
+    "💰 Новый баланс: *{balance} STAR*\n\n"
+    "🎮 Сыграть ещё?"
+)
+
+_DICE_TMPL = (
+    "🎲 *Банановые кости*\n\n"
+    "💰 Ваш баланс: *{balance} STAR*\n"
+    "🎯 Угадайте число от 1 до 6\n"
+    "📈 Шанс выигрыша: 1/6 (16.6%)\n"
+    "💰 Множитель: x3.0\n\n"
+    "Выберите число:"
+)
+
+_DICE_BET_TMPL = (
+    "🎲 Вы выбрали число: *{number}*\n\n"
+    "💰 Введите сумму ставки (минимум {min_bet} STAR):"
+)
+
+_DICE_RESULT_TMPL = (
+    "🎲 *Банановые кости*\n\n"
+    "💰 Ставка: *{bet} STAR*\n"
+    "🎲 Вы загадали: *{number}*\n"
+    "{result}\n\n"
+    "💰 Новый баланс: *{balance} STAR*\n\n"
+    "🎮 Сыграть ещё?"
+)
+
+_JACKPOT_TMPL = (
+    "💰 *Джекпот*\n\n"
+    "💰 Ваш баланс: *{balance} STAR*\n"
+    "🎰 1% шанс выигрыша\n"
+    "💰 Множитель: x100\n"
+    "🏆 Текущий джекпот: *{jackpot:.2f} STAR*\n\n"
+    "Купить билеты:"
+)
+
+_JACKPOT_RESULT_TMPL = (
+    "💰 *Джекпот*\n\n"
+    "🎫 Куплено билетов: *{tickets}*\n"
+    "💰 Потрачено: *{bet} STAR*\n"
+    "{result}\n\n"
+    "💰 Новый баланс: *{balance} STAR*\n\n"
+    "🎮 Купить ещё билетов?"
+)
+
+_WITHDRAW_TEXT = (
+    "💸 *Вывод средств*\n\n"
+    "📋 Требования для вывода:\n"
+    "1. Баланс ≥ выбранной суммы\n"
+    "2. 3 активных реферала (подписанных на спонсоров)\n\n"
+    "Выберите сумму:"
+)
+
+_PROFILE_TMPL = (
+    "📊 *Профиль*\n\n"
+    "👤 ID: `{user_id}`\n"
+    "👤 Имя: {full_name}\n"
+    "💰 Баланс: *{balance} STAR*\n"
+    "👥 Рефералов: *{active_ref}* / {total_ref}\n\n"
+    "🎮 *Статистика игр:*\n"
+    "• Сыграно игр: {games_played}\n"
+    "• Побед: {games_won}\n"
+    "• Процент побед: {win_rate:.1f}%\n"
+    "• Всего поставлено: {total_wagered} STAR\n\n"
+    "⏰ Кликер доступен: {next_click}"
+)
+
+_REFERRAL_TMPL = (
+    "👥 *Реферальная система*\n\n"
+    "🔗 Ваша реферальная ссылка:\n"
+    "`https://t.me/MonkeyStarsBot?start={user_id}`\n\n"
+    "📊 Статистика:\n"
+    "• Приглашено: *{total_ref}*\n"
+    "• Активных: *{active_ref}*\n\n"
+    "🎁 *Правила:*\n"
+    "• Вы получаете *3 STAR*, а друг *2 STAR* после подписки на спонсоров\n"
+    "• Вы получаете *10%* от всех кликов реферала\n"
+    "• Для вывода нужно *3 активных реферала*"
+)
+
+_ADMIN_PANEL_TMPL = (
+    "👑 *Админ панель*\n\n"
+    "📊 Краткая статистика:\n"
+    "• Пользователей: {total_users}\n"
+    "• Общий баланс: {total_balance} STAR\n"
+    "• Всего поставлено: {total_wagered} STAR\n"
+    "• Заявок на вывод: {pending_withdrawals}"
+)
+
+_ADMIN_STATS_TMPL = (
+    "📈 *Детальная статистика*\n\n"
+    "👥 Пользователей: {total_users}\n"
+    "💰 Общий баланс: {total_balance} STAR\n"
+    "🎮 Всего поставлено: {total_wagered} STAR\n"
+    "📥 Заявок на вывод: {pending_withdrawals}\n\n"
+    "🏆 Топ-10 по балансу:\n"
+    "{top}"
+)
+
 # ========== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==========
 
+@lru_cache(maxsize=1024)
 def format_balance(balance: float) -> str:
     return f"{balance:.2f}"
 
+@lru_cache(maxsize=4096)
 def format_time(seconds: int) -> str:
-    if seconds < 60:
-        return f"{seconds} сек"
-    elif seconds < 3600:
-        return f"{seconds // 60} мин {seconds % 60} сек"
-    else:
-        return f"{seconds // 3600} ч {(seconds % 3600) // 60} мин"
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    if minutes:
+        return f"{minutes} мин {seconds} сек"
+    return f"{seconds} сек"
 
-def create_main_menu(user_id: int) -> InlineKeyboardMarkup:
-    keyboard = [
-        [InlineKeyboardButton(text="🐵 Заработать звезды", callback_data="earn")],
-        [InlineKeyboardButton(text="🎮 Играть в игры", callback_data="play_games")],
-        [InlineKeyboardButton(text="📊 Профиль", callback_data="profile")],
-        [InlineKeyboardButton(text="👥 Реферальная система", callback_data="referral")],
-    ]
-    
-    # Добавляем админ панель для администратора
-    if user_id == Config.ADMIN_ID:
-        keyboard.append([InlineKeyboardButton(text="👑 Админ панель", callback_data="admin_panel")])
+# Последнее содержимое отредактированных сообщений: (chat_id, message_id) -> (текст, клавиатура, parse_mode).
+# Бот работает одним процессом (FSM, кэши и защита от повторных нажатий тоже в памяти процесса)
+_last_edits = TTLCache(maxsize=Config.CACHE_MAX_USERS, ttl=3600)
+
+async def safe_edit(message: Message, text: str,
+                    reply_markup: Optional[InlineKeyboardMarkup] = None,
+                    parse_mode: Optional[str] = None):
+    """Отредактировать сообщение, пропуская правки без изменений"""
+    key = (message.chat.id, message.message_id)
+    content = (text, reply_markup, parse_mode)
+    if _last_edits.get(key) == content:
+        return
     
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    try:
+        await message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    _last_edits[key] = content
+
+def create_main_menu(user_id: int) -> InlineKeyboardMarkup:
+    # Админ панель показываем только администратору
+    return _MAIN_MENU_KB_ADMIN if user_id == _ADMIN_ID else _MAIN_MENU_KB_USER
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора до завершения
+_background_tasks = set()
+
+def run_in_background(coro):
+    """Запустить корутину отдельной задачей, не дожидаясь ее"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def get_cached_user(user_id: int) -> Optional[dict]:
+    """Пользователь, уже прочитанный в этом апдейте, иначе из БД"""
+    users = request_users.get()
+    if users is None:
+        return await db.get_user(user_id)
+    if user_id not in users:
+        users[user_id] = await db.get_user(user_id)
+    return users[user_id]
 
 async def check_subscriptions(user_id: int) -> bool:
     """Проверить подписки пользователя на спонсоров"""
     try:
-        sponsors_status = db.get_user_sponsors_status(user_id)
-        if not sponsors_status:  # Если нет спонсоров
-            return True
-        
-        for sponsor in sponsors_status:
-            if not sponsor.get('is_subscribed', False):
-                return False
-        return True
+        return await db.user_is_fully_subscribed(user_id)
     except Exception as e:
-        logger.error(f"Error checking subscriptions for {user_id}: {e}")
+        logger.error("Error checking subscriptions for %s: %s", user_id, e)
         return False
 
 # ========== ОБРАБОТЧИКИ КОМАНД ==========
@@ -97,7 +483,7 @@ async def cmd_start(message: Message, command: CommandObject = None):
     user_id = message.from_user.id
     username = message.from_user.username or message.from_user.first_name
     
-    logger.info(f"User {user_id} ({username}) started bot")
+    logger.info("User %s (%s) started bot", user_id, username)
     
     # Обработка реферальной ссылки
     referrer_id = None
@@ -110,7 +496,7 @@ async def cmd_start(message: Message, command: CommandObject = None):
             referrer_id = None
     
     # Создаем/обновляем пользователя
-    db.create_user(user_id, username, referrer_id)
+    await db.create_user(user_id, username, referrer_id)
     
     # Проверяем подписки
     if not await check_subscriptions(user_id):
@@ -122,7 +508,7 @@ async def cmd_start(message: Message, command: CommandObject = None):
 
 async def show_sponsors_message(message: Message, user_id: int):
     """Показать сообщение о необходимости подписки"""
-    sponsors = db.get_sponsors()
+    sponsors = await db.get_sponsors()
     
     if not sponsors:
         await show_main_menu(message)
@@ -145,8 +531,7 @@ async def show_sponsors_message(message: Message, user_id: int):
     ])
     
     await message.answer(
-        "📢 *Чтобы начать, подпишитесь на наших спонсоров!*\n\n"
-        "После подписки нажмите кнопку ниже:",
+        _SPONSORS_TEXT,
         reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
         parse_mode="Markdown"
     )
@@ -154,15 +539,11 @@ async def show_sponsors_message(message: Message, user_id: int):
 async def show_main_menu(message: Message, text: str = None):
     """Показать главное меню"""
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     
     balance = user['balance'] if user else 0.0
     
-    welcome_text = text or (
-        "🐵 *Monkey Stars*\n\n"
-        f"💰 Баланс: *{format_balance(balance)} STAR*\n\n"
-        "Выберите действие:"
-    )
+    welcome_text = text or _MAIN_MENU_TMPL.format(balance=format_balance(balance))
     
     await message.answer(
         welcome_text,
@@ -178,12 +559,11 @@ async def handle_check_subscriptions(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     # Имитируем успешную подписку (в реальности нужно проверять через getChatMember)
-    sponsors = db.get_sponsors()
-    for sponsor in sponsors:
-        db.update_user_sponsor_status(user_id, sponsor['id'], True)
-    
-    await callback.answer("✅ Отлично! Доступ открыт!")
-    await callback.message.delete()
+    await asyncio.gather(
+        db.mark_all_sponsors_subscribed(user_id),
+        bot.answer_callback_query(callback.id, text="✅ Отлично! Доступ открыт!"),
+        bot.delete_message(callback.message.chat.id, callback.message.message_id)
+    )
     await show_main_menu(callback.message)
 
 @dp.callback_query(F.data == "earn")
@@ -196,19 +576,31 @@ async def handle_earn(callback: CallbackQuery):
         await show_sponsors_message(callback.message, user_id)
         return
     
-    keyboard = [
-        [InlineKeyboardButton(text="🎯 Кликнуть (+0.2 STAR)", callback_data="click")],
-        [InlineKeyboardButton(text="💸 Вывод средств", callback_data="withdraw_menu")],
-        [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
-    ]
-    
-    await callback.message.edit_text(
-        "🐵 *Заработать звезды*\n\n"
-        "Выберите способ заработка:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _EARN_TEXT,
+        reply_markup=_EARN_KB,
         parse_mode="Markdown"
     )
 
+def _click_key(user_id: int) -> str:
+    return f"click_cd:{user_id}"
+
+async def claim_click(user_id: int, user: dict, now: int) -> int:
+    """Занять кулдаун клика: 0 — клик разрешен, иначе сколько секунд ждать"""
+    last_click = user.get('last_click')
+    if last_click and (now - last_click) < _CLICK_COOLDOWN:
+        return _CLICK_COOLDOWN - (now - last_click)
+    
+    if redis is None:
+        return 0
+    
+    # SET NX: из одновременных кликов проходит только один, ключ истекает сам
+    key = _click_key(user_id)
+    if await redis.set(key, 1, nx=True, ex=_CLICK_COOLDOWN):
+        return 0
+    return max(await redis.ttl(key), 1)
+
 @dp.callback_query(F.data == "click")
 async def handle_click(callback: CallbackQuery):
     """Обработка кликера"""
@@ -218,49 +610,50 @@ async def handle_click(callback: CallbackQuery):
         await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
         return
     
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
         return
     
-    current_time = int(datetime.now().timestamp())
-    last_click = user.get('last_click')
+    current_time = int(time.time())
     
     # Проверка кулдауна
-    if last_click and (current_time - last_click) < Config.CLICK_COOLDOWN:
-        remaining = Config.CLICK_COOLDOWN - (current_time - last_click)
+    remaining = await claim_click(user_id, user, current_time)
+    if remaining:
         await callback.answer(f"⏳ Подождите {format_time(remaining)}")
         return
     
     # Начисление клика
-    reward = Config.CLICK_REWARD
-    db.update_balance(user_id, reward)
-    db.update_last_click(user_id, current_time)
-    db.add_transaction(user_id, reward, "click", "Кликер")
-    
+    reward = _CLICK_REWARD
+
     # Реферальный бонус (10%)
     referrer_id = user.get('referrer_id')
-    if referrer_id:
-        referral_bonus = reward * (Config.CLICK_REFERRAL_PERCENT / 100)
-        db.update_balance(referrer_id, referral_bonus)
-        db.add_transaction(
-            referrer_id,
-            referral_bonus,
-            "referral_income",
-            f"10% от клика пользователя {callback.from_user.username or user_id}"
-        )
-    
-    # Обновляем сообщение
-    user = db.get_user(user_id)
-    await callback.message.edit_text(
-        f"✅ *Вы получили {reward} STAR!*\n\n"
-        f"💰 Баланс: *{format_balance(user['balance'])} STAR*\n\n"
-        f"⏰ Следующий клик через 1 час",
-        parse_mode="Markdown",
-        reply_markup=callback.message.reply_markup
+    referral_bonus = reward * _CLICK_REFERRAL_SHARE if referrer_id else 0.0
+
+    new_balance = await db.record_click(
+        user_id,
+        reward,
+        current_time,
+        referrer_id,
+        referral_bonus,
+        f"10% от клика пользователя {callback.from_user.username or user_id}"
+    )
+    if new_balance is None:
+        if redis is not None:
+            await redis.delete(_click_key(user_id))
+        await callback.answer("❌ Произошла ошибка")
+        return
+
+    # Обновляем сообщение и отвечаем на callback параллельно
+    await asyncio.gather(
+        safe_edit(
+            callback.message,
+            _CLICK_TMPL.format(reward=reward, balance=format_balance(new_balance)),
+            parse_mode="Markdown",
+            reply_markup=callback.message.reply_markup
+        ),
+        bot.answer_callback_query(callback.id, text=f"+{reward} STAR")
     )
-    
-    await callback.answer(f"+{reward} STAR")
 
 # ========== ИГРЫ ==========
 
@@ -273,23 +666,10 @@ async def handle_play_games(callback: CallbackQuery):
         await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
         return
     
-    keyboard = [
-        [InlineKeyboardButton(text=Config.GAMES['flip']['name'], callback_data="game_flip")],
-        [InlineKeyboardButton(text=Config.GAMES['crash']['name'], callback_data="game_crash")],
-        [InlineKeyboardButton(text=Config.GAMES['slot']['name'], callback_data="game_slot")],
-        [InlineKeyboardButton(text=Config.GAMES['dice']['name'], callback_data="game_dice")],
-        [InlineKeyboardButton(text=Config.GAMES['jackpot']['name'], callback_data="game_jackpot")],
-        [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
-    ]
-    
-    await callback.message.edit_text(
-        "🎮 *Выберите игру:*\n\n"
-        "💎 *Monkey Flip* - Подбрось банан и угадай сторону\n"
-        "🚀 *Banana Crash* - Забери деньги до краша\n"
-        "🎰 *Банановый слот* - Крути барабаны\n"
-        "🎲 *Банановые кости* - Угадай число\n"
-        "💰 *Джекпот* - Выиграй x100",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _GAMES_TEXT,
+        reply_markup=_GAMES_KB,
         parse_mode="Markdown"
     )
 
@@ -297,7 +677,7 @@ async def handle_play_games(callback: CallbackQuery):
 async def handle_game_flip(callback: CallbackQuery, state: FSMContext):
     """Игра Monkey Flip"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
@@ -306,114 +686,35 @@ async def handle_game_flip(callback: CallbackQuery, state: FSMContext):
     await state.set_state(GameStates.playing_flip)
     await state.update_data(game_type="flip")
     
-    keyboard = [
-        [InlineKeyboardButton(text="🍌 Banana", callback_data="flip_heads")],
-        [InlineKeyboardButton(text="🐵 Monkey", callback_data="flip_tails")],
-        [InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")]
-    ]
-    
-    await callback.message.edit_text(
-        f"🎯 *Monkey Flip*\n\n"
-        f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*\n"
-        f"📈 Шанс выигрыша: *49%*\n"
-        f"🎲 Множитель: *x2.0*\n\n"
-        f"Выберите сторону:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _FLIP_TMPL.format(balance=format_balance(user['balance'])),
+        reply_markup=_FLIP_KB,
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data.startswith("flip_"))
-async def handle_flip_choice(callback: CallbackQuery, state: FSMContext):
+async def handle_flip_choice(callback: CallbackQuery, state: FSMContext, choice: str):
     """Обработка выбора в игре Flip"""
     user_id = callback.from_user.id
-    choice = callback.data.split("_")[1]  # heads или tails
     
     # Запрашиваем ставку
-    await callback.message.edit_text(
-        f"🎯 Вы выбрали: {'🍌 Banana' if choice == 'heads' else '🐵 Monkey'}\n\n"
-        f"💰 Введите сумму ставки (минимум {Config.MIN_BETS['flip']} STAR):",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="◀️ Отмена", callback_data="game_flip")]
-        ])
+    await safe_edit(
+        callback.message,
+        _FLIP_BET_TMPL.format(
+            side='🍌 Banana' if choice == 'heads' else '🐵 Monkey',
+            min_bet=_MIN_BET_FLIP
+        ),
+        reply_markup=_FLIP_CANCEL_KB
     )
     
     await state.update_data(flip_choice=choice)
     await state.set_state(GameStates.choosing_bet)
 
-@dp.message(GameStates.choosing_bet)
-async def handle_bet_input(message: Message, state: FSMContext):
-    """Обработка ввода ставки"""
-    user_id = message.from_user.id
-    user = db.get_user(user_id)
-    
-    if not user:
-        await message.answer("❌ Ошибка, попробуйте /start")
-        await state.clear()
-        return
-    
-    try:
-        bet = float(message.text)
-        
-        # Проверка минимальной ставки
-        min_bet = Config.MIN_BETS['flip']
-        if bet < min_bet:
-            await message.answer(f"❌ Минимальная ставка: {min_bet} STAR")
-            return
-        
-        # Проверка баланса
-        if user['balance'] < bet:
-            await message.answer(f"❌ Недостаточно STAR. Ваш баланс: {format_balance(user['balance'])}")
-            return
-        
-        # Получаем данные о выборе
-        data = await state.get_data()
-        choice = data.get('flip_choice')
-        game_type = data.get('game_type')
-        
-        if game_type == "flip":
-            # Играем в Flip
-            win, amount, result_text = GameEngine.play_flip(bet, choice)
-            
-            # Обновляем баланс и статистику
-            if win:
-                db.update_balance(user_id, amount - bet)
-                db.add_transaction(user_id, amount - bet, "game_win", f"Monkey Flip выигрыш x2.0")
-                db.update_game_stats(user_id, bet, True)
-            else:
-                db.update_balance(user_id, -bet)
-                db.add_transaction(user_id, -bet, "game_lose", "Monkey Flip проигрыш")
-                db.update_game_stats(user_id, bet, False)
-            
-            # Получаем обновленный баланс
-            user = db.get_user(user_id)
-            
-            await message.answer(
-                f"🎯 *Monkey Flip*\n\n"
-                f"{result_text}\n\n"
-                f"💰 Новый баланс: *{format_balance(user['balance'])} STAR*\n\n"
-                f"🎮 Сыграть ещё?",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🎯 Играть снова", callback_data="game_flip")],
-                    [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
-                    [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")]
-                ]),
-                parse_mode="Markdown"
-            )
-        
-        await state.clear()
-        
-    except ValueError:
-        await message.answer("❌ Введите число!")
-    except Exception as e:
-        logger.error(f"Error in handle_bet_input: {e}")
-        await message.answer("❌ Произошла ошибка")
-        await state.clear()
-
 @dp.callback_query(F.data == "game_crash")
 async def handle_game_crash(callback: CallbackQuery, state: FSMContext):
     """Игра Banana Crash"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
@@ -421,36 +722,24 @@ async def handle_game_crash(callback: CallbackQuery, state: FSMContext):
     
     await state.update_data(game_type="crash")
     
-    keyboard = [
-        [InlineKeyboardButton(text="🚀 Играть (ставка 1 STAR)", callback_data="crash_play_1")],
-        [InlineKeyboardButton(text="🚀 Играть (ставка 5 STAR)", callback_data="crash_play_5")],
-        [InlineKeyboardButton(text="🚀 Играть (ставка 10 STAR)", callback_data="crash_play_10")],
-        [InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")]
-    ]
-    
-    await callback.message.edit_text(
-        f"🚀 *Banana Crash*\n\n"
-        f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*\n"
-        f"📈 Множитель растет от x1.00\n"
-        f"💥 60% шанс мгновенного краша\n"
-        f"🎰 2% шанс на высокий множитель\n\n"
-        f"Выберите ставку:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _CRASH_TMPL.format(balance=format_balance(user['balance'])),
+        reply_markup=_CRASH_KB,
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data.startswith("crash_play_"))
-async def handle_crash_play(callback: CallbackQuery, state: FSMContext):
+async def handle_crash_play(callback: CallbackQuery, state: FSMContext, bet_arg: str):
     """Играем в Crash"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
         return
     
     try:
-        bet = float(callback.data.split("_")[2])
+        bet = float(bet_arg)
         
         # Проверка баланса
         if user['balance'] < bet:
@@ -462,75 +751,56 @@ async def handle_crash_play(callback: CallbackQuery, state: FSMContext):
         
         # Обновляем баланс и статистику
         if win:
-            db.update_balance(user_id, amount - bet)
-            db.add_transaction(user_id, amount - bet, "game_win", f"Banana Crash выигрыш x{amount/bet:.2f}")
-            db.update_game_stats(user_id, bet, True)
+            new_balance = await db.settle_game(user_id, bet, amount - bet, "game_win", f"Banana Crash выигрыш x{amount/bet:.2f}", True)
         else:
-            db.update_balance(user_id, -bet)
-            db.add_transaction(user_id, -bet, "game_lose", "Banana Crash проигрыш")
-            db.update_game_stats(user_id, bet, False)
+            new_balance = await db.settle_game(user_id, bet, -bet, "game_lose", "Banana Crash проигрыш", False)
         
-        # Получаем обновленный баланс
-        user = db.get_user(user_id)
+        if new_balance is None:
+            await callback.answer("❌ Произошла ошибка")
+            return
         
-        await callback.message.edit_text(
-            f"🚀 *Banana Crash*\n\n"
-            f"💰 Ставка: *{bet} STAR*\n"
-            f"{result_text}\n\n"
-            f"💰 Новый баланс: *{format_balance(user['balance'])} STAR*\n\n"
-            f"🎮 Сыграть ещё?",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🚀 Играть снова", callback_data="game_crash")],
-                [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
-                [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")]
-            ]),
-            parse_mode="Markdown"
+        await asyncio.gather(
+            safe_edit(
+                callback.message,
+                _CRASH_RESULT_TMPL.format(bet=bet, result=result_text, balance=format_balance(new_balance)),
+                reply_markup=_CRASH_RESULT_KB,
+                parse_mode="Markdown"
+            ),
+            bot.answer_callback_query(callback.id)
         )
         
     except Exception as e:
-        logger.error(f"Error in handle_crash_play: {e}")
+        logger.error("Error in handle_crash_play: %s", e)
         await callback.answer("❌ Произошла ошибка")
 
 @dp.callback_query(F.data == "game_slot")
 async def handle_game_slot(callback: CallbackQuery):
     """Игра Слот-машина"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
         return
     
-    keyboard = [
-        [InlineKeyboardButton(text="🎰 Крутить (1 STAR)", callback_data="slot_play_1")],
-        [InlineKeyboardButton(text="🎰 Крутить (5 STAR)", callback_data="slot_play_5")],
-        [InlineKeyboardButton(text="🎰 Крутить (10 STAR)", callback_data="slot_play_10")],
-        [InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")]
-    ]
-    
-    await callback.message.edit_text(
-        f"🎰 *Банановый слот*\n\n"
-        f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*\n"
-        f"🎯 3 одинаковых символа = x20\n"
-        f"🍌 3 банана = ДЖЕКПОТ x50!\n"
-        f"📊 Шанс выигрыша: 1/27\n\n"
-        f"Выберите ставку:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _SLOT_TMPL.format(balance=format_balance(user['balance'])),
+        reply_markup=_SLOT_KB,
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data.startswith("slot_play_"))
-async def handle_slot_play(callback: CallbackQuery):
+async def handle_slot_play(callback: CallbackQuery, state: FSMContext, bet_arg: str):
     """Играем в слоты"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
         return
     
     try:
-        bet = float(callback.data.split("_")[2])
+        bet = float(bet_arg)
         
         # Проверка баланса
         if user['balance'] < bet:
@@ -542,100 +812,141 @@ async def handle_slot_play(callback: CallbackQuery):
         
         # Обновляем баланс и статистику
         if win:
-            db.update_balance(user_id, amount - bet)
-            db.add_transaction(user_id, amount - bet, "game_win", f"Слоты выигрыш x{amount/bet:.2f}")
-            db.update_game_stats(user_id, bet, True)
+            new_balance = await db.settle_game(user_id, bet, amount - bet, "game_win", f"Слоты выигрыш x{amount/bet:.2f}", True)
         else:
-            db.update_balance(user_id, -bet)
-            db.add_transaction(user_id, -bet, "game_lose", "Слоты проигрыш")
-            db.update_game_stats(user_id, bet, False)
+            new_balance = await db.settle_game(user_id, bet, -bet, "game_lose", "Слоты проигрыш", False)
         
-        # Получаем обновленный баланс
-        user = db.get_user(user_id)
+        if new_balance is None:
+            await callback.answer("❌ Произошла ошибка")
+            return
         
-        await callback.message.edit_text(
-            f"🎰 *Банановый слот*\n\n"
-            f"💰 Ставка: *{bet} STAR*\n"
-            f"🎰 Результат: *{reels}*\n"
-            f"{result_text}\n\n"
-            f"💰 Новый баланс: *{format_balance(user['balance'])} STAR*\n\n"
-            f"🎮 Сыграть ещё?",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🎰 Крутить снова", callback_data="game_slot")],
-                [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
-                [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")]
-            ]),
-            parse_mode="Markdown"
+        await asyncio.gather(
+            safe_edit(
+                callback.message,
+                _SLOT_RESULT_TMPL.format(
+                    bet=bet,
+                    reels=reels,
+                    result=result_text,
+                    balance=format_balance(new_balance)
+                ),
+                reply_markup=_SLOT_RESULT_KB,
+                parse_mode="Markdown"
+            ),
+            bot.answer_callback_query(callback.id)
         )
         
     except Exception as e:
-        logger.error(f"Error in handle_slot_play: {e}")
+        logger.error("Error in handle_slot_play: %s", e)
         await callback.answer("❌ Произошла ошибка")
 
 @dp.callback_query(F.data == "game_dice")
 async def handle_game_dice(callback: CallbackQuery, state: FSMContext):
     """Игра Банановые кости"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
         return
     
     await state.set_state(GameStates.playing_dice)
+    await state.update_data(game_type="dice")
     
-    # Создаем клавиатуру с числами 1-6
-    keyboard = []
-    for i in range(1, 7):
-        keyboard.append([InlineKeyboardButton(text=f"🎲 {i}", callback_data=f"dice_{i}")])
-    
-    keyboard.append([InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")])
-    
-    await callback.message.edit_text(
-        f"🎲 *Банановые кости*\n\n"
-        f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*\n"
-        f"🎯 Угадайте число от 1 до 6\n"
-        f"📈 Шанс выигрыша: 1/6 (16.6%)\n"
-        f"💰 Множитель: x3.0\n\n"
-        f"Выберите число:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _DICE_TMPL.format(balance=format_balance(user['balance'])),
+        reply_markup=_DICE_KB,
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data.startswith("dice_"))
-async def handle_dice_choice(callback: CallbackQuery, state: FSMContext):
+async def handle_dice_choice(callback: CallbackQuery, state: FSMContext, number_arg: str):
     """Обработка выбора числа в Dice"""
     user_id = callback.from_user.id
-    user_number = int(callback.data.split("_")[1])
+    user_number = int(number_arg)
     
     # Запрашиваем ставку
-    await callback.message.edit_text(
-        f"🎲 Вы выбрали число: *{user_number}*\n\n"
-        f"💰 Введите сумму ставки (минимум {Config.MIN_BETS['dice']} STAR):",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="◀️ Отмена", callback_data="game_dice")]
-        ])
+    await safe_edit(
+        callback.message,
+        _DICE_BET_TMPL.format(number=user_number, min_bet=_MIN_BET_DICE),
+        reply_markup=_DICE_CANCEL_KB
     )
     
     await state.update_data(dice_number=user_number)
     await state.set_state(GameStates.choosing_bet)
 
+async def _play_flip_bet(user_id: int, bet: float, data: dict) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Ставка в Monkey Flip"""
+    win, amount, result_text = GameEngine.play_flip(bet, data.get('flip_choice'))
+    
+    # Обновляем баланс и статистику
+    if win:
+        new_balance = await db.settle_game(user_id, bet, amount - bet, "game_win", "Monkey Flip выигрыш x2.0", True)
+    else:
+        new_balance = await db.settle_game(user_id, bet, -bet, "game_lose", "Monkey Flip проигрыш", False)
+    
+    if new_balance is None:
+        return None
+    
+    return (
+        _FLIP_RESULT_TMPL.format(result=result_text, balance=format_balance(new_balance)),
+        _FLIP_RESULT_KB
+    )
+
+async def _play_dice_bet(user_id: int, bet: float, data: dict) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Ставка в Банановые кости"""
+    user_number = data.get('dice_number')
+    win, amount, result_text = GameEngine.play_dice(bet, user_number)
+    
+    # Обновляем баланс и статистику
+    if win:
+        new_balance = await db.settle_game(user_id, bet, amount - bet, "game_win", "Кости выигрыш x3.0", True)
+    else:
+        new_balance = await db.settle_game(user_id, bet, -bet, "game_lose", "Кости проигрыш", False)
+    
+    if new_balance is None:
+        return None
+    
+    return (
+        _DICE_RESULT_TMPL.format(
+            bet=bet,
+            number=user_number,
+            result=result_text,
+            balance=format_balance(new_balance)
+        ),
+        _DICE_RESULT_KB
+    )
+
+# game_type -> (минимальная ставка, розыгрыш)
+_BET_GAMES = {
+    "flip": (_MIN_BET_FLIP, _play_flip_bet),
+    "dice": (_MIN_BET_DICE, _play_dice_bet),
+}
+
 @dp.message(GameStates.choosing_bet)
-async def handle_dice_bet(message: Message, state: FSMContext):
-    """Обработка ставки для Dice"""
+async def handle_bet_input(message: Message, state: FSMContext):
+    """Обработка ввода ставки (Flip и Dice)"""
     user_id = message.from_user.id
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     
     if not user:
         await message.answer("❌ Ошибка, попробуйте /start")
         await state.clear()
         return
     
+    # Получаем данные о выбранной игре
+    data = await state.get_data()
+    game = _BET_GAMES.get(data.get('game_type'))
+    if not game:
+        await message.answer("❌ Ошибка, выберите игру заново")
+        await state.clear()
+        return
+    
+    min_bet, play = game
+    
     try:
         bet = float(message.text)
         
         # Проверка минимальной ставки
-        min_bet = Config.MIN_BETS['dice']
         if bet < min_bet:
             await message.answer(f"❌ Минимальная ставка: {min_bet} STAR")
             return
@@ -645,47 +956,21 @@ async def handle_dice_bet(message: Message, state: FSMContext):
             await message.answer(f"❌ Недостаточно STAR. Ваш баланс: {format_balance(user['balance'])}")
             return
         
-        # Получаем данные о выборе числа
-        data = await state.get_data()
-        user_number = data.get('dice_number')
-        
-        # Играем в Dice
-        win, amount, result_text = GameEngine.play_dice(bet, user_number)
-        
-        # Обновляем баланс и статистику
-        if win:
-            db.update_balance(user_id, amount - bet)
-            db.add_transaction(user_id, amount - bet, "game_win", f"Кости выигрыш x3.0")
-            db.update_game_stats(user_id, bet, True)
-        else:
-            db.update_balance(user_id, -bet)
-            db.add_transaction(user_id, -bet, "game_lose", "Кости проигрыш")
-            db.update_game_stats(user_id, bet, False)
+        result = await play(user_id, bet, data)
+        if result is None:
+            await message.answer("❌ Произошла ошибка")
+            await state.clear()
+            return
         
-        # Получаем обновленный баланс
-        user = db.get_user(user_id)
-        
-        await message.answer(
-            f"🎲 *Банановые кости*\n\n"
-            f"💰 Ставка: *{bet} STAR*\n"
-            f"🎲 Вы загадали: *{user_number}*\n"
-            f"{result_text}\n\n"
-            f"💰 Новый баланс: *{format_balance(user['balance'])} STAR*\n\n"
-            f"🎮 Сыграть ещё?",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🎲 Играть снова", callback_data="game_dice")],
-                [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
-                [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")]
-            ]),
-            parse_mode="Markdown"
-        )
+        text, keyboard = result
+        await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
         
         await state.clear()
         
     except ValueError:
         await message.answer("❌ Введите число!")
     except Exception as e:
-        logger.error(f"Error in handle_dice_bet: {e}")
+        logger.error("Error in handle_bet_input: %s", e)
         await message.answer("❌ Произошла ошибка")
         await state.clear()
 
@@ -693,42 +978,33 @@ async def handle_dice_bet(message: Message, state: FSMContext):
 async def handle_game_jackpot(callback: CallbackQuery):
     """Игра Джекпот"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user, total_wagered = await asyncio.gather(get_cached_user(user_id), db.get_total_wagered())
     
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
         return
     
-    keyboard = [
-        [InlineKeyboardButton(text="💰 Купить билет (1 STAR)", callback_data="jackpot_play_1")],
-        [InlineKeyboardButton(text="💰 Купить 5 билетов (5 STAR)", callback_data="jackpot_play_5")],
-        [InlineKeyboardButton(text="💰 Купить 10 билетов (10 STAR)", callback_data="jackpot_play_10")],
-        [InlineKeyboardButton(text="◀️ Назад к играм", callback_data="play_games")]
-    ]
-    
-    await callback.message.edit_text(
-        f"💰 *Джекпот*\n\n"
-        f"💰 Ваш баланс: *{format_balance(user['balance'])} STAR*\n"
-        f"🎰 1% шанс выигрыша\n"
-        f"💰 Множитель: x100\n"
-        f"🏆 Текущий джекпот: *{(db.get_stats()['total_wagered'] * 0.1):.2f} STAR*\n\n"
-        f"Купить билеты:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _JACKPOT_TMPL.format(
+            balance=format_balance(user['balance']),
+            jackpot=total_wagered * 0.1
+        ),
+        reply_markup=_JACKPOT_KB,
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data.startswith("jackpot_play_"))
-async def handle_jackpot_play(callback: CallbackQuery):
+async def handle_jackpot_play(callback: CallbackQuery, state: FSMContext, bet_arg: str):
     """Играем в Джекпот"""
     user_id = callback.from_user.id
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
         return
     
     try:
-        bet = float(callback.data.split("_")[2])
+        bet = float(bet_arg)
         tickets = int(bet)  # 1 билет за 1 STAR
         
         # Проверка баланса
@@ -736,29 +1012,18 @@ async def handle_jackpot_play(callback: CallbackQuery):
             await callback.answer(f"❌ Недостаточно STAR. Баланс: {format_balance(user['balance'])}")
             return
         
-        # Сначала списываем деньги за билеты
-        db.update_balance(user_id, -bet)
-        db.add_transaction(user_id, -bet, "game_lose", f"Покупка {tickets} билетов джекпота")
-        db.update_game_stats(user_id, bet, False)
-        
-        # Играем для каждого билета
-        total_win = 0
-        win_tickets = 0
-        
-        for i in range(tickets):
-            win, amount, _ = GameEngine.play_jackpot(1.0)
-            if win:
-                total_win += amount
-                win_tickets += 1
+        # Разыгрываем все билеты одним броском
+        win_tickets, total_win = GameEngine.play_jackpot_batch(tickets, 1.0)
         
-        # Если есть выигрыш - начисляем
+        # Списываем стоимость билетов и начисляем выигрыш одной операцией
         if total_win > 0:
-            db.update_balance(user_id, total_win)
-            db.add_transaction(user_id, total_win, "game_win", f"Джекпот выигрыш x{total_win:.0f}")
-            db.update_game_stats(user_id, 0, True)  # Обновляем статистику побед
+            new_balance = await db.settle_game(user_id, bet, total_win - bet, "game_win", f"Джекпот выигрыш x{total_win:.0f} ({tickets} билетов)", True)
+        else:
+            new_balance = await db.settle_game(user_id, bet, -bet, "game_lose", f"Покупка {tickets} билетов джекпота", False)
         
-        # Получаем обновленный баланс
-        user = db.get_user(user_id)
+        if new_balance is None:
+            await callback.answer("❌ Произошла ошибка")
+            return
         
         result_text = ""
         if win_tickets > 0:
@@ -766,23 +1031,23 @@ async def handle_jackpot_play(callback: CallbackQuery):
         else:
             result_text = f"😢 Ни один билет не выиграл. Попробуйте еще раз!"
         
-        await callback.message.edit_text(
-            f"💰 *Джекпот*\n\n"
-            f"🎫 Куплено билетов: *{tickets}*\n"
-            f"💰 Потрачено: *{bet} STAR*\n"
-            f"{result_text}\n\n"
-            f"💰 Новый баланс: *{format_balance(user['balance'])} STAR*\n\n"
-            f"🎮 Купить ещё билетов?",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="💰 Купить билеты", callback_data="game_jackpot")],
-                [InlineKeyboardButton(text="🎮 Все игры", callback_data="play_games")],
-                [InlineKeyboardButton(text="🐵 Главное меню", callback_data="main_menu")]
-            ]),
-            parse_mode="Markdown"
+        await asyncio.gather(
+            safe_edit(
+                callback.message,
+                _JACKPOT_RESULT_TMPL.format(
+                    tickets=tickets,
+                    bet=bet,
+                    result=result_text,
+                    balance=format_balance(new_balance)
+                ),
+                reply_markup=_JACKPOT_RESULT_KB,
+                parse_mode="Markdown"
+            ),
+            bot.answer_callback_query(callback.id)
         )
         
     except Exception as e:
-        logger.error(f"Error in handle_jackpot_play: {e}")
+        logger.error("Error in handle_jackpot_play: %s", e)
         await callback.answer("❌ Произошла ошибка")
 
 # ========== ВЫВОД СРЕДСТВ ==========
@@ -796,39 +1061,38 @@ async def handle_withdraw_menu(callback: CallbackQuery):
         await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
         return
     
-    keyboard = []
-    for amount in Config.WITHDRAWAL_AMOUNTS:
-        keyboard.append([
-            InlineKeyboardButton(
-                text=f"{amount} STAR",
-                callback_data=f"withdraw_{amount}"
-            )
-        ])
-    
-    keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data="earn")])
-    
-    await callback.message.edit_text(
-        "💸 *Вывод средств*\n\n"
-        "📋 Требования для вывода:\n"
-        "1. Баланс ≥ выбранной суммы\n"
-        "2. 3 активных реферала (подписанных на спонсоров)\n\n"
-        "Выберите сумму:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _WITHDRAW_TEXT,
+        reply_markup=_WITHDRAW_KB,
         parse_mode="Markdown"
     )
 
-@dp.callback_query(F.data.startswith("withdraw_"))
-async def handle_withdraw(callback: CallbackQuery):
+async def _notify_admin(withdrawal_id: int, user_id: int, username: Optional[str], amount: float):
+    """Уведомление админа о новой заявке на вывод"""
+    try:
+        await bot.send_message(
+            _ADMIN_ID,
+            f"📥 Новая заявка на вывод!\n"
+            f"👤 Пользователь: @{username or user_id}\n"
+            f"💰 Сумма: {amount} STAR\n"
+            f"📝 ID: {withdrawal_id}\n"
+            f"🆔 User ID: {user_id}"
+        )
+    except Exception as e:
+        logger.error("Не удалось уведомить админа о выводе #%s: %s", withdrawal_id, e)
+
+async def handle_withdraw(callback: CallbackQuery, state: FSMContext, amount_arg: str):
     """Обработка вывода"""
     user_id = callback.from_user.id
     
     try:
-        amount = float(callback.data.split("_")[1])
+        amount = float(amount_arg)
     except:
         await callback.answer("❌ Ошибка суммы")
         return
     
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
         return
@@ -838,44 +1102,31 @@ async def handle_withdraw(callback: CallbackQuery):
         await callback.answer(f"❌ Недостаточно STAR. Ваш баланс: {format_balance(user['balance'])}")
         return
     
-    # Проверка активных рефералов
-    total_ref, active_ref = db.get_user_referrals(user_id)
+    # Проверка активных рефералов (счетчик из строки пользователя, кэш до USER_CACHE_TTL секунд)
+    active_ref = user.get('active_referrals', 0)
     if active_ref < 3:
         await callback.answer(f"❌ Нужно 3 активных реферала. У вас: {active_ref}")
         return
     
-    # Создание заявки на вывод
-    withdrawal = db.create_withdrawal(user_id, amount)
-    if not withdrawal:
+    # Создание заявки на вывод со списанием баланса
+    withdrawal_id = await db.create_withdrawal(user_id, amount)
+    if not withdrawal_id:
         await callback.answer("❌ Ошибка при создании заявки")
         return
     
-    # Списание баланса
-    db.update_balance(user_id, -amount)
-    db.add_transaction(user_id, -amount, "withdrawal", f"Вывод #{withdrawal['id']}")
-    
     # Отправляем сообщение об успехе
-    await callback.message.edit_text(
+    await safe_edit(
+        callback.message,
         f"✅ *Заявка на вывод одобрена!*\n\n"
         f"💰 Сумма: *{amount} STAR*\n"
-        f"📝 ID заявки: *#{withdrawal['id']}*\n\n"
+        f"📝 ID заявки: *#{withdrawal_id}*\n\n"
         f"Для получения средств свяжитесь с поддержкой: @MonkeyStarsov\n"
         f"Укажите ваш ID: `{user_id}` и сумму: `{amount} STAR`",
         parse_mode="Markdown"
     )
     
-    # Уведомляем админа
-    try:
-        await bot.send_message(
-            Config.ADMIN_ID,
-            f"📥 Новая заявка на вывод!\n"
-            f"👤 Пользователь: @{callback.from_user.username or user_id}\n"
-            f"💰 Сумма: {amount} STAR\n"
-            f"📝 ID: {withdrawal['id']}\n"
-            f"🆔 User ID: {user_id}"
-        )
-    except:
-        pass
+    # Уведомляем админа в фоне, не задерживая ответ пользователю
+    run_in_background(_notify_admin(withdrawal_id, user_id, callback.from_user.username, amount))
 
 # ========== ПРОФИЛЬ И РЕФЕРАЛКА ==========
 
@@ -888,12 +1139,13 @@ async def handle_profile(callback: CallbackQuery):
         await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
         return
     
-    user = db.get_user(user_id)
+    user = await get_cached_user(user_id)
     if not user:
         await callback.answer("❌ Ошибка, попробуйте /start")
         return
     
-    total_ref, active_ref = db.get_user_referrals(user_id)
+    total_ref = user.get('total_referrals', 0)
+    active_ref = user.get('active_referrals', 0)
     
     # Статистика игр
     games_played = user.get('games_played', 0)
@@ -904,37 +1156,33 @@ async def handle_profile(callback: CallbackQuery):
     
     # Время до следующего клика
     last_click = user.get('last_click')
-    current_time = int(datetime.now().timestamp())
+    current_time = int(time.time())
     
     if last_click:
         time_passed = current_time - last_click
-        if time_passed < Config.CLICK_COOLDOWN:
-            remaining = Config.CLICK_COOLDOWN - time_passed
+        if time_passed < _CLICK_COOLDOWN:
+            remaining = _CLICK_COOLDOWN - time_passed
             next_click = f"через {format_time(remaining)}"
         else:
             next_click = "сейчас"
     else:
         next_click = "сейчас"
     
-    text = (
-        f"📊 *Профиль*\n\n"
-        f"👤 ID: `{user_id}`\n"
-        f"👤 Имя: {callback.from_user.full_name}\n"
-        f"💰 Баланс: *{format_balance(user['balance'])} STAR*\n"
-        f"👥 Рефералов: *{active_ref}* / {total_ref}\n\n"
-        f"🎮 *Статистика игр:*\n"
-        f"• Сыграно игр: {games_played}\n"
-        f"• Побед: {games_won}\n"
-        f"• Процент побед: {win_rate:.1f}%\n"
-        f"• Всего поставлено: {format_balance(total_wagered)} STAR\n\n"
-        f"⏰ Кликер доступен: {next_click}"
-    )
-    
-    keyboard = [[InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]]
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _PROFILE_TMPL.format(
+            user_id=user_id,
+            full_name=callback.from_user.full_name,
+            balance=format_balance(user['balance']),
+            active_ref=active_ref,
+            total_ref=total_ref,
+            games_played=games_played,
+            games_won=games_won,
+            win_rate=win_rate,
+            total_wagered=format_balance(total_wagered),
+            next_click=next_click
+        ),
+        reply_markup=_BACK_KB,
         parse_mode="Markdown"
     )
 
@@ -947,26 +1195,12 @@ async def handle_referral(callback: CallbackQuery):
         await callback.answer("❌ Сначала подпишитесь на спонсоров!", show_alert=True)
         return
     
-    total_ref, active_ref = db.get_user_referrals(user_id)
-    
-    text = (
-        f"👥 *Реферальная система*\n\n"
-        f"🔗 Ваша реферальная ссылка:\n"
-        f"`https://t.me/MonkeyStarsBot?start={user_id}`\n\n"
-        f"📊 Статистика:\n"
-        f"• Приглашено: *{total_ref}*\n"
-        f"• Активных: *{active_ref}*\n\n"
-        f"🎁 *Правила:*\n"
-        f"• Вы получаете *3 STAR*, а друг *2 STAR* после подписки на спонсоров\n"
-        f"• Вы получаете *10%* от всех кликов реферала\n"
-        f"• Для вывода нужно *3 активных реферала*"
-    )
-    
-    keyboard = [[InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]]
+    total_ref, active_ref = await db.get_user_referrals(user_id)
     
-    await callback.message.edit_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    await safe_edit(
+        callback.message,
+        _REFERRAL_TMPL.format(user_id=user_id, total_ref=total_ref, active_ref=active_ref),
+        reply_markup=_BACK_KB,
         parse_mode="Markdown"
     )
 
@@ -975,75 +1209,55 @@ async def handle_referral(callback: CallbackQuery):
 @dp.callback_query(F.data == "admin_panel")
 async def handle_admin_panel(callback: CallbackQuery):
     """Админ панель"""
-    if callback.from_user.id != Config.ADMIN_ID:
+    if callback.from_user.id != _ADMIN_ID:
         await callback.answer("❌ Доступ запрещен")
         return
     
-    stats = db.get_stats()
-    
-    keyboard = [
-        [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
-        [InlineKeyboardButton(text="👥 Пользователи", callback_data="admin_users")],
-        [InlineKeyboardButton(text="📢 Добавить спонсора", callback_data="admin_add_sponsor")],
-        [InlineKeyboardButton(text="📢 Рассылка", callback_data="admin_broadcast")],
-        [InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu")]
-    ]
-    
-    text = (
-        f"👑 *Админ панель*\n\n"
-        f"📊 Краткая статистика:\n"
-        f"• Пользователей: {stats['total_users']}\n"
-        f"• Общий баланс: {format_balance(stats['total_balance'])} STAR\n"
-        f"• Всего поставлено: {format_balance(stats['total_wagered'])} STAR\n"
-        f"• Заявок на вывод: {stats['pending_withdrawals']}"
-    )
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+    stats = await db.get_stats()
+    
+    await safe_edit(
+        callback.message,
+        _ADMIN_PANEL_TMPL.format(
+            total_users=stats['total_users'],
+            total_balance=format_balance(stats['total_balance']),
+            total_wagered=format_balance(stats['total_wagered']),
+            pending_withdrawals=stats['pending_withdrawals']
+        ),
+        reply_markup=_ADMIN_PANEL_KB,
         parse_mode="Markdown"
     )
 
 @dp.callback_query(F.data == "admin_stats")
 async def handle_admin_stats(callback: CallbackQuery):
     """Детальная статистика"""
-    if callback.from_user.id != Config.ADMIN_ID:
+    if callback.from_user.id != _ADMIN_ID:
         return
     
-    stats = db.get_stats()
-    users = db.get_all_users()
-    
     # Топ-10 по балансу
-    top_users = sorted(users, key=lambda x: x['balance'], reverse=True)[:10]
+    stats, top_users = await asyncio.gather(db.get_stats(), db.get_top_users(10))
     
-    top_text = "🏆 Топ-10 по балансу:\n"
+    top_lines = []
     for i, user in enumerate(top_users, 1):
         username = f"@{user['username']}" if user['username'] else f"user_{user['user_id']}"
-        top_text += f"{i}. {username}: {format_balance(user['balance'])} STAR\n"
-    
-    text = (
-        f"📈 *Детальная статистика*\n\n"
-        f"👥 Пользователей: {stats['total_users']}\n"
-        f"💰 Общий баланс: {format_balance(stats['total_balance'])} STAR\n"
-        f"🎮 Всего поставлено: {format_balance(stats['total_wagered'])} STAR\n"
-        f"📥 Заявок на вывод: {stats['pending_withdrawals']}\n\n"
-        f"{top_text}"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton(text="◀️ В админ панель", callback_data="admin_panel")]
-    ]
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard),
+        top_lines.append(f"{i}. {username}: {format_balance(user['balance'])} STAR\n")
+    
+    await safe_edit(
+        callback.message,
+        _ADMIN_STATS_TMPL.format(
+            total_users=stats['total_users'],
+            total_balance=format_balance(stats['total_balance']),
+            total_wagered=format_balance(stats['total_wagered']),
+            pending_withdrawals=stats['pending_withdrawals'],
+            top="".join(top_lines)
+        ),
+        reply_markup=_BACK_TO_ADMIN_KB,
         parse_mode="Markdown"
     )
 
 @dp.message(Command("admin"))
 async def cmd_admin(message: Message):
     """Команда /admin"""
-    if message.from_user.id != Config.ADMIN_ID:
+    if message.from_user.id != _ADMIN_ID:
         await message.answer("❌ Доступ запрещен")
         return
     
@@ -1057,26 +1271,85 @@ async def handle_back_to_main(callback: CallbackQuery):
     await callback.message.delete()
     await show_main_menu(callback.message)
 
+# ========== CALLBACK С ПАРАМЕТРОМ ==========
+
+# Префикс callback_data (до последнего "_") -> обработчик(callback, state, параметр)
+_CB_ROUTES = {
+    "flip": handle_flip_choice,
+    "crash_play": handle_crash_play,
+    "slot_play": handle_slot_play,
+    "dice": handle_dice_choice,
+    "jackpot_play": handle_jackpot_play,
+    "withdraw": handle_withdraw,
+}
+
+# Регистрируется последним: точные совпадения (withdraw_menu, game_flip...) обрабатываются выше
+@dp.callback_query()
+async def handle_routed_callback(callback: CallbackQuery, state: FSMContext):
+    """Диспетчер callback вида flip_heads, crash_play_5, withdraw_25"""
+    prefix, _, arg = (callback.data or "").rpartition("_")
+    handler = _CB_ROUTES.get(prefix)
+    if handler is None:
+        await callback.answer()
+        return
+    
+    await handler(callback, state, arg)
+
 # ========== ЗАПУСК БОТА ==========
 
+async def run_webhook():
+    """Прием апдейтов вебхуком через aiohttp-сервер"""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=Config.WEBHOOK_SECRET
+    ).register(app, path=Config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, Config.WEBAPP_HOST, Config.WEBAPP_PORT).start()
+        await bot.set_webhook(
+            f"{Config.WEBHOOK_URL}{Config.WEBHOOK_PATH}",
+            secret_token=Config.WEBHOOK_SECRET
+        )
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
 async def main():
     """Основная функция запуска"""
     logger.info("🚀 Запуск бота Monkey Stars...")
-    logger.info(f"👑 Админ ID: {Config.ADMIN_ID}")
+    logger.info("👑 Админ ID: %s", Config.ADMIN_ID)
     
     try:
         # Проверяем подключение к БД
-        stats = db.get_stats()
-        logger.info(f"✅ База данных подключена. Пользователей: {stats['total_users']}")
+        if await db.ping():
+            logger.info("✅ База данных подключена")
         
         # Запускаем бота
         logger.info("✅ Бот успешно запущен!")
-        await dp.start_polling(bot)
+        if Config.WEBHOOK_URL:
+            await run_webhook()
+        else:
+            await dp.start_polling(bot)
         
     except Exception as e:
-        logger.error(f"❌ Критическая ошибка: {e}")
+        logger.error("❌ Критическая ошибка: %s", e)
     finally:
         await bot.session.close()
+        await db.close()
+        if redis is not None:
+            await redis.aclose()
+        _log_listener.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # uvloop — более быстрый цикл событий, если установлен
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
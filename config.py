@@ -4,12 +4,23 @@ class Config:
     # Токен бота (из переменных окружения)
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     
+    # Вебхук (если WEBHOOK_URL не задан — long polling)
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+    WEBHOOK_PATH = "/webhook"
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+    WEBAPP_HOST = "0.0.0.0"
+    WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+    
     # ID администратора
     ADMIN_ID = 7973988177
     
     # Supabase (используем ту же базу)
     SUPABASE_URL = "https://lzmvkp5wrkoms.hv.qb2usq.supabase.co"
     SUPABASE_KEY = "sb_publishable_lZmVKp5wrkoOMsHvQB2UsQ_jkmn1gul"
+    DB_TIMEOUT = 10
+    
+    # Redis для кулдауна кликов (необязательно, без него кулдаун проверяется по БД)
+    REDIS_URL = os.getenv("REDIS_URL")
     
     # Настройки игры
     CLICK_REWARD = 0.2
@@ -18,6 +29,24 @@ class Config:
     REFERRAL_REWARD_REFEREE = 2.0
     CLICK_REFERRAL_PERCENT = 10
     
+    # Кэширование чтений из БД (секунды)
+    USER_CACHE_TTL = 30
+    SPONSORS_CACHE_TTL = 300  # меняются только через add_sponsor, который сбрасывает кэш
+    JACKPOT_CACHE_TTL = 5
+    STATS_CACHE_TTL = 60
+    CACHE_MAX_USERS = 10_000
+    
+    # Состояния FSM в памяти (брошенные сценарии удаляются)
+    FSM_STATE_TTL = 600
+    FSM_MAX_STATES = 10_000
+    
+    # Пул соединений к Telegram API (0 — без общего лимита)
+    TELEGRAM_POOL_LIMIT = 0
+    TELEGRAM_POOL_LIMIT_PER_HOST = 256
+    TELEGRAM_TIMEOUT = 60
+    TELEGRAM_RATE_LIMIT = 30  # отправок и правок в секунду на бота
+    TELEGRAM_CHAT_RATE_LIMIT = 1  # отправок в секунду в один чат
+    
     # Суммы для вывода
     WITHDRAWAL_AMOUNTS = [15, 25, 50, 100]
     
@@ -1,7 +1,9 @@
-from supabase import create_client, Client
-from datetime import datetime
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from cachetools import TTLCache
 from config import Config
 import logging
+import time
 from typing import Optional, Dict, List, Tuple
 
 logger = logging.getLogger(__name__)
@@ -10,34 +12,65 @@ class Database:
     def __init__(self):
         try:
             logger.info("🔄 Подключаемся к Supabase...")
-            self.supabase: Client = create_client(
-                Config.SUPABASE_URL,
-                Config.SUPABASE_KEY
+            # Асинхронный клиент PostgREST: запросы не блокируют цикл событий,
+            # соединения переиспользуются пулом httpx
+            self.client = AsyncPostgrestClient(
+                f"{Config.SUPABASE_URL}/rest/v1",
+                headers={
+                    **DEFAULT_POSTGREST_CLIENT_HEADERS,
+                    "apikey": Config.SUPABASE_KEY,
+                    "Authorization": f"Bearer {Config.SUPABASE_KEY}"
+                },
+                timeout=Config.DB_TIMEOUT
             )
             logger.info("✅ Подключение к Supabase успешно")
         except Exception as e:
-            logger.error(f"❌ Ошибка подключения к Supabase: {e}")
+            logger.error("❌ Ошибка подключения к Supabase: %s", e)
             raise
+        
+        # Кэши чтения (сбрасываются при записи)
+        self._users_cache = TTLCache(maxsize=Config.CACHE_MAX_USERS, ttl=Config.USER_CACHE_TTL)
+        self._subscribed_cache = TTLCache(maxsize=Config.CACHE_MAX_USERS, ttl=Config.USER_CACHE_TTL)
+        self._sponsors_cache = TTLCache(maxsize=1, ttl=Config.SPONSORS_CACHE_TTL)
+        self._total_wagered_cache = TTLCache(maxsize=1, ttl=Config.JACKPOT_CACHE_TTL)
+        self._stats_cache = TTLCache(maxsize=1, ttl=Config.STATS_CACHE_TTL)
     
     # === ПОЛЬЗОВАТЕЛИ ===
-    def get_user(self, user_id: int) -> Optional[Dict]:
+    async def get_user(self, user_id: int) -> Optional[Dict]:
+        user = self._users_cache.get(user_id)
+        if user is not None:
+            return user
+        
         try:
-            response = self.supabase.table("users")\
+            response = await self.client.table("users")\
                 .select("*")\
                 .eq("user_id", user_id)\
                 .execute()
-            return response.data[0] if response.data else None
+            if not response.data:
+                return None
+            
+            user = response.data[0]
+            self._users_cache[user_id] = user
+            return user
         except Exception as e:
-            logger.error(f"Ошибка получения пользователя {user_id}: {e}")
+            logger.error("Ошибка получения пользователя %s: %s", user_id, e)
             return None
     
-    def create_user(self, user_id: int, username: str, referrer_id: int = None) -> bool:
+    def _store_user(self, user_id: int, rows: List[Dict]) -> bool:
+        # Строка, возвращенная после записи, сразу кладется в кэш вместо повторного чтения
+        if not rows:
+            self._users_cache.pop(user_id, None)
+            return False
+        self._users_cache[user_id] = rows[0]
+        return True
+    
+    async def create_user(self, user_id: int, username: str, referrer_id: int = None) -> bool:
         try:
             user_data = {
                 "user_id": user_id,
                 "username": username or f"user_{user_id}",
                 "referrer_id": referrer_id,
-                "created_at": int(datetime.now().timestamp()),
+                "created_at": int(time.time()),
                 "balance": 0.0,
                 "last_click": None,
                 "total_wagered": 0.0,
@@ -45,17 +78,18 @@ class Database:
                 "games_won": 0
             }
             
-            response = self.supabase.table("users")\
+            response = await self.client.table("users")\
                 .upsert(user_data, on_conflict="user_id")\
                 .execute()
+            self._users_cache.pop(user_id, None)
             
             # Начисляем реферальные бонусы
             if referrer_id and response.data:
-                referrer = self.get_user(referrer_id)
+                referrer = await self.get_user(referrer_id)
                 if referrer:
                     # Бонус рефереру
-                    self.update_balance(referrer_id, Config.REFERRAL_REWARD_REFERRER)
-                    self.add_transaction(
+                    await self.update_balance(referrer_id, Config.REFERRAL_REWARD_REFERRER)
+                    await self.add_transaction(
                         referrer_id,
                         Config.REFERRAL_REWARD_REFERRER,
                         "referral_bonus",
@@ -63,8 +97,8 @@ class Database:
                     )
                     
                     # Бонус рефералу
-                    self.update_balance(user_id, Config.REFERRAL_REWARD_REFEREE)
-                    self.add_transaction(
+                    await self.update_balance(user_id, Config.REFERRAL_REWARD_REFEREE)
+                    await self.add_transaction(
                         user_id,
                         Config.REFERRAL_REWARD_REFEREE,
                         "referral_bonus",
@@ -73,228 +107,293 @@ class Database:
             
             return bool(response.data)
         except Exception as e:
-            logger.error(f"Ошибка создания пользователя {user_id}: {e}")
+            logger.error("Ошибка создания пользователя %s: %s", user_id, e)
             return False
     
-    def update_balance(self, user_id: int, amount: float) -> bool:
+    async def update_balance(self, user_id: int, amount: float) -> bool:
         try:
-            user = self.get_user(user_id)
-            if not user:
-                return False
-            
-            new_balance = user["balance"] + amount
-            
-            response = self.supabase.table("users")\
-                .update({"balance": new_balance})\
-                .eq("user_id", user_id)\
-                .execute()
-            
-            return bool(response.data)
+            # Атомарное приращение на сервере вместо чтения и записи баланса
+            response = await self.client.rpc("increment_balance", {
+                "p_user_id": user_id,
+                "p_delta": amount
+            }).execute()
+            return self._store_user(user_id, response.data)
         except Exception as e:
-            logger.error(f"Ошибка обновления баланса {user_id}: {e}")
+            logger.error("Ошибка обновления баланса %s: %s", user_id, e)
             return False
     
-    def update_last_click(self, user_id: int, timestamp: int) -> bool:
+    async def update_last_click(self, user_id: int, timestamp: int) -> bool:
         try:
-            response = self.supabase.table("users")\
+            response = await self.client.table("users")\
                 .update({"last_click": timestamp})\
                 .eq("user_id", user_id)\
                 .execute()
+            self._users_cache.pop(user_id, None)
             return bool(response.data)
         except Exception as e:
-            logger.error(f"Ошибка обновления last_click {user_id}: {e}")
+            logger.error("Ошибка обновления last_click %s: %s", user_id, e)
             return False
-    
-    def update_game_stats(self, user_id: int, wagered: float, won: bool) -> bool:
+
+    async def record_click(self, user_id: int, reward: float, timestamp: int,
+                     referrer_id: int = None, referral_bonus: float = 0.0,
+                     comment: str = "") -> Optional[float]:
+        # Одна транзакция на сервере: баланс, last_click, транзакции, бонус рефереру
         try:
-            user = self.get_user(user_id)
-            if not user:
-                return False
-            
-            updates = {
-                "total_wagered": user.get("total_wagered", 0.0) + wagered,
-                "games_played": user.get("games_played", 0) + 1
-            }
-            
-            if won:
-                updates["games_won"] = user.get("games_won", 0) + 1
-            
-            response = self.supabase.table("users")\
-                .update(updates)\
-                .eq("user_id", user_id)\
-                .execute()
-            
-            return bool(response.data)
+            response = await self.client.rpc("record_click", {
+                "p_user_id": user_id,
+                "p_reward": reward,
+                "p_ts": timestamp,
+                "p_referrer_id": referrer_id,
+                "p_referral_bonus": referral_bonus,
+                "p_comment": comment
+            }).execute()
+            self._users_cache.pop(user_id, None)
+            self._users_cache.pop(referrer_id, None)
+            return response.data
+        except Exception as e:
+            logger.error("Ошибка начисления клика %s: %s", user_id, e)
+            return None
+
+    async def settle_game(self, user_id: int, bet: float, delta: float, type: str,
+                    description: str, won: bool) -> Optional[float]:
+        # Баланс, статистика игр и транзакция одним вызовом, возвращает новый баланс
+        try:
+            response = await self.client.rpc("settle_game", {
+                "p_user_id": user_id,
+                "p_bet": bet,
+                "p_delta": delta,
+                "p_type": type,
+                "p_comment": description,
+                "p_won": won,
+                "p_ts": int(time.time())
+            }).execute()
+            self._users_cache.pop(user_id, None)
+            return response.data
+        except Exception as e:
+            logger.error("Ошибка расчета игры %s: %s", user_id, e)
+            return None
+
+    async def update_game_stats(self, user_id: int, wagered: float, won: bool) -> bool:
+        try:
+            response = await self.client.rpc("increment_game_stats", {
+                "p_user_id": user_id,
+                "p_wagered": wagered,
+                "p_won": won
+            }).execute()
+            return self._store_user(user_id, response.data)
         except Exception as e:
-            logger.error(f"Ошибка обновления статистики игр {user_id}: {e}")
+            logger.error("Ошибка обновления статистики игр %s: %s", user_id, e)
             return False
     
     # === СПОНСОРЫ ===
-    def get_sponsors(self) -> List[Dict]:
+    async def get_sponsors(self) -> List[Dict]:
+        sponsors = self._sponsors_cache.get("all")
+        if sponsors is not None:
+            return sponsors
+        
         try:
-            response = self.supabase.table("sponsors")\
+            response = await self.client.table("sponsors")\
                 .select("*")\
                 .execute()
+            self._sponsors_cache["all"] = response.data
             return response.data
         except Exception as e:
-            logger.error(f"Ошибка получения спонсоров: {e}")
+            logger.error("Ошибка получения спонсоров: %s", e)
             return []
     
-    def get_user_sponsors_status(self, user_id: int) -> List[Dict]:
+    async def user_is_fully_subscribed(self, user_id: int) -> bool:
+        subscribed = self._subscribed_cache.get(user_id)
+        if subscribed is not None:
+            return subscribed
+        
         try:
-            # Получаем всех спонсоров
-            sponsors = self.get_sponsors()
-            if not sponsors:
-                return []
-            
-            # Получаем статусы подписки
-            response = self.supabase.table("user_sponsors")\
-                .select("sponsor_id, is_subscribed")\
-                .eq("user_id", user_id)\
-                .execute()
-            
-            subscribed_ids = {row['sponsor_id']: row['is_subscribed'] for row in response.data}
-            
-            # Формируем результат
-            result = []
-            for sponsor in sponsors:
-                result.append({
-                    **sponsor,
-                    'is_subscribed': subscribed_ids.get(sponsor['id'], False)
-                })
-            
-            return result
+            response = await self.client.rpc("user_is_fully_subscribed", {
+                "p_user_id": user_id
+            }).execute()
+            subscribed = bool(response.data)
+            self._subscribed_cache[user_id] = subscribed
+            return subscribed
         except Exception as e:
-            logger.error(f"Ошибка получения статуса подписок {user_id}: {e}")
-            return []
+            logger.error("Ошибка проверки подписок %s: %s", user_id, e)
+            return False
     
-    def update_user_sponsor_status(self, user_id: int, sponsor_id: int, is_subscribed: bool) -> bool:
+    async def update_user_sponsor_status(self, user_id: int, sponsor_id: int, is_subscribed: bool) -> bool:
         try:
-            response = self.supabase.table("user_sponsors")\
+            response = await self.client.table("user_sponsors")\
                 .upsert({
                     "user_id": user_id,
                     "sponsor_id": sponsor_id,
                     "is_subscribed": is_subscribed,
-                    "last_check": int(datetime.now().timestamp())
+                    "last_check": int(time.time())
                 }, on_conflict="user_id,sponsor_id")\
                 .execute()
+            
+            # Обновляем закэшированный итог проверки вместо повторного чтения
+            if is_subscribed:
+                self._subscribed_cache.pop(user_id, None)
+            else:
+                self._subscribed_cache[user_id] = False
+            
             return bool(response.data)
         except Exception as e:
-            logger.error(f"Ошибка обновления статуса подписки: {e}")
+            logger.error("Ошибка обновления статуса подписки: %s", e)
             return False
     
-    # === РЕФЕРАЛЫ ===
-    def get_user_referrals(self, user_id: int) -> Tuple[int, int]:
+    async def mark_all_sponsors_subscribed(self, user_id: int) -> bool:
         try:
-            # Все рефералы
-            response = self.supabase.table("users")\
-                .select("user_id")\
-                .eq("referrer_id", user_id)\
-                .execute()
-            total = len(response.data) if response.data else 0
+            sponsors = await self.get_sponsors()
+            if not sponsors:
+                return True
             
-            # Активные рефералы (которые подписаны на хотя бы одного спонсора)
-            active = 0
-            for referral in response.data:
-                referral_status = self.get_user_sponsors_status(referral['user_id'])
-                if any(s['is_subscribed'] for s in referral_status):
-                    active += 1
+            # Один upsert на все строки: недостающие создаются, существующие обновляются
+            now = int(time.time())
+            await self.client.table("user_sponsors")\
+                .upsert([
+                    {
+                        "user_id": user_id,
+                        "sponsor_id": sponsor['id'],
+                        "is_subscribed": True,
+                        "last_check": now
+                    }
+                    for sponsor in sponsors
+                ], on_conflict="user_id,sponsor_id")\
+                .execute()
             
-            return total, active
+            self._subscribed_cache[user_id] = True
+            return True
         except Exception as e:
-            logger.error(f"Ошибка получения рефералов {user_id}: {e}")
+            logger.error("Ошибка обновления подписок %s: %s", user_id, e)
+            return False
+    
+    # === РЕФЕРАЛЫ ===
+    async def get_user_referrals(self, user_id: int) -> Tuple[int, int]:
+        # Счетчики поддерживаются триггерами в БД и приходят вместе со строкой пользователя
+        user = await self.get_user(user_id)
+        if not user:
             return 0, 0
+        return user.get('total_referrals', 0), user.get('active_referrals', 0)
     
     # === ТРАНЗАКЦИИ ===
-    def add_transaction(self, user_id: int, amount: float, type: str, description: str = "") -> bool:
+    async def add_transaction(self, user_id: int, amount: float, type: str, description: str = "") -> bool:
         try:
-            response = self.supabase.table("transactions")\
+            response = await self.client.table("transactions")\
                 .insert({
                     "user_id": user_id,
                     "amount": amount,
                     "type": type,
                     "description": description,
-                    "created_at": int(datetime.now().timestamp())
+                    "created_at": int(time.time())
                 })\
                 .execute()
             return bool(response.data)
         except Exception as e:
-            logger.error(f"Ошибка добавления транзакции: {e}")
+            logger.error("Ошибка добавления транзакции: %s", e)
             return False
     
     # === ВЫВОД СРЕДСТВ ===
-    def create_withdrawal(self, user_id: int, amount: float) -> Optional[Dict]:
+    async def create_withdrawal(self, user_id: int, amount: float) -> Optional[int]:
+        # Проверка баланса, списание, заявка и транзакция в одной транзакции на сервере.
+        # Возвращает ID заявки или None, если баланса не хватает
         try:
-            response = self.supabase.table("withdrawals")\
-                .insert({
-                    "user_id": user_id,
-                    "amount": amount,
-                    "status": "pending",
-                    "created_at": int(datetime.now().timestamp())
-                })\
-                .execute()
-            return response.data[0] if response.data else None
+            response = await self.client.rpc("create_withdrawal", {
+                "p_user_id": user_id,
+                "p_amount": amount,
+                "p_ts": int(time.time())
+            }).execute()
+            self._users_cache.pop(user_id, None)
+            return response.data
         except Exception as e:
-            logger.error(f"Ошибка создания вывода: {e}")
+            logger.error("Ошибка создания вывода: %s", e)
             return None
     
     # === АДМИН ФУНКЦИИ ===
-    def get_all_users(self) -> List[Dict]:
+    async def get_all_users(self) -> List[Dict]:
         try:
-            response = self.supabase.table("users")\
+            response = await self.client.table("users")\
                 .select("*")\
                 .order("created_at", desc=True)\
                 .execute()
             return response.data
         except Exception as e:
-            logger.error(f"Ошибка получения всех пользователей: {e}")
+            logger.error("Ошибка получения всех пользователей: %s", e)
             return []
     
-    def get_stats(self) -> Dict:
+    async def get_top_users(self, limit: int = 10) -> List[Dict]:
         try:
-            # Количество пользователей
-            users_resp = self.supabase.table("users")\
-                .select("user_id", count="exact")\
-                .execute()
-            
-            # Общий баланс
-            balance_resp = self.supabase.table("users")\
-                .select("balance")\
-                .execute()
-            total_balance = sum(user['balance'] for user in balance_resp.data) if balance_resp.data else 0
-            
-            # Общая сумма ставок
-            wagered_resp = self.supabase.table("users")\
-                .select("total_wagered")\
-                .execute()
-            total_wagered = sum(user['total_wagered'] for user in wagered_resp.data) if wagered_resp.data else 0
-            
-            # Заявки на вывод
-            withdrawals_resp = self.supabase.table("withdrawals")\
-                .select("id", count="exact")\
-                .eq("status", "pending")\
+            # Сортировка и лимит на стороне БД, передаются только нужные поля
+            response = await self.client.table("users")\
+                .select("user_id, username, balance")\
+                .order("balance", desc=True)\
+                .limit(limit)\
                 .execute()
-            
-            return {
-                "total_users": users_resp.count or 0,
-                "total_balance": total_balance,
-                "total_wagered": total_wagered,
-                "pending_withdrawals": withdrawals_resp.count or 0
+            return response.data
+        except Exception as e:
+            logger.error("Ошибка получения топа пользователей: %s", e)
+            return []
+    
+    async def get_total_wagered(self) -> float:
+        total = self._total_wagered_cache.get("all")
+        if total is not None:
+            return total
+        
+        try:
+            # Сумма считается в базе, наружу уходит одно число
+            response = await self.client.rpc("get_total_wagered", {}).execute()
+            total = float(response.data or 0)
+            self._total_wagered_cache["all"] = total
+            return total
+        except Exception as e:
+            logger.error("Ошибка получения суммы ставок: %s", e)
+            return 0.0
+    
+    async def get_stats(self) -> Dict:
+        stats = self._stats_cache.get("all")
+        if stats is not None:
+            return stats
+        
+        try:
+            # Все агрегаты одним запросом, без выгрузки таблицы users
+            response = await self.client.rpc("get_admin_stats", {}).execute()
+            row = response.data[0]
+            stats = {
+                "total_users": row['total_users'] or 0,
+                "total_balance": row['total_balance'] or 0,
+                "total_wagered": row['total_wagered'] or 0,
+                "pending_withdrawals": row['pending_withdrawals'] or 0
             }
+            self._stats_cache["all"] = stats
+            return stats
         except Exception as e:
-            logger.error(f"Ошибка получения статистики: {e}")
+            logger.error("Ошибка получения статистики: %s", e)
             return {"total_users": 0, "total_balance": 0, "total_wagered": 0, "pending_withdrawals": 0}
     
-    def add_sponsor(self, channel_username: str, channel_id: str, channel_url: str) -> bool:
+    async def add_sponsor(self, channel_username: str, channel_id: str, channel_url: str) -> bool:
         try:
-            response = self.supabase.table("sponsors")\
+            response = await self.client.table("sponsors")\
                 .insert({
                     "channel_username": channel_username,
                     "channel_id": channel_id,
                     "channel_url": channel_url
                 })\
                 .execute()
+            self._sponsors_cache.clear()
+            self._subscribed_cache.clear()
             return bool(response.data)
         except Exception as e:
-            logger.error(f"Ошибка добавления спонсора: {e}")
+            logger.error("Ошибка добавления спонсора: %s", e)
             return False
+    
+    async def ping(self) -> bool:
+        try:
+            # Легкий запрос для проверки соединения (одна строка, один столбец)
+            await self.client.table("users")\
+                .select("user_id")\
+                .limit(1)\
+                .execute()
+            return True
+        except Exception as e:
+            logger.error("Ошибка подключения к базе данных: %s", e)
+            return False
+    
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,276 @@
+-- Серверные функции для Supabase (выполнить в SQL Editor)
+-- Каждая функция выполняется в одной транзакции и вызывается через rpc()
+
+-- Клик: начисление награды, обновление last_click, транзакции и реферальный бонус
+create or replace function record_click(
+    p_user_id bigint,
+    p_reward double precision,
+    p_ts bigint,
+    p_referrer_id bigint,
+    p_referral_bonus double precision,
+    p_comment text
+) returns double precision
+language plpgsql as $$
+declare
+    new_balance double precision;
+begin
+    -- Не ждать сброса WAL на диск при коммите (аналог synchronous=NORMAL):
+    -- при падении сервера можно потерять последние клики/игры, но не целостность
+    set local synchronous_commit = off;
+
+    update users
+       set balance = balance + p_reward,
+           last_click = p_ts
+     where user_id = p_user_id
+    returning balance into new_balance;
+
+    if not found then
+        return null;
+    end if;
+
+    insert into transactions (user_id, amount, type, description, created_at)
+    values (p_user_id, p_reward, 'click', 'Кликер', p_ts);
+
+    if p_referrer_id is not null then
+        update users
+           set balance = balance + p_referral_bonus
+         where user_id = p_referrer_id;
+
+        -- referrer_id из /start не проверяется: несуществующему рефереру ничего не пишем
+        if found then
+            insert into transactions (user_id, amount, type, description, created_at)
+            values (p_referrer_id, p_referral_bonus, 'referral_income', p_comment, p_ts);
+        end if;
+    end if;
+
+    return new_balance;
+end;
+$$;
+
+-- Итог игры: баланс, статистика и запись транзакции за один вызов.
+-- Возвращает null, если пользователя нет или баланса не хватает на проигрыш
+create or replace function settle_game(
+    p_user_id bigint,
+    p_bet double precision,
+    p_delta double precision,
+    p_type text,
+    p_comment text,
+    p_won boolean,
+    p_ts bigint
+) returns double precision
+language plpgsql as $$
+declare
+    new_balance double precision;
+begin
+    -- Не ждать сброса WAL на диск при коммите (аналог synchronous=NORMAL):
+    -- при падении сервера можно потерять последние клики/игры, но не целостность
+    set local synchronous_commit = off;
+
+    update users
+       set balance = balance + p_delta,
+           total_wagered = total_wagered + p_bet,
+           games_played = games_played + 1,
+           games_won = games_won + p_won::int
+     where user_id = p_user_id
+       and balance + p_delta >= 0  -- одновременные ставки не уводят баланс в минус
+    returning balance into new_balance;
+
+    if not found then
+        return null;
+    end if;
+
+    insert into transactions (user_id, amount, type, description, created_at)
+    values (p_user_id, p_delta, p_type, p_comment, p_ts);
+
+    return new_balance;
+end;
+$$;
+
+-- Подписан ли пользователь на всех спонсоров (нет спонсоров — считаем подписанным)
+create or replace function user_is_fully_subscribed(p_user_id bigint)
+returns boolean
+language sql stable as $$
+    select not exists (
+        select 1
+          from sponsors s
+         where not exists (
+            select 1
+              from user_sponsors us
+             where us.user_id = p_user_id
+               and us.sponsor_id = s.id
+               and us.is_subscribed
+         )
+    );
+$$;
+
+-- Общая сумма ставок (для джекпота) одним числом вместо выборки всех строк
+create or replace function get_total_wagered()
+returns double precision
+language sql stable as $$
+    select coalesce(sum(total_wagered), 0) from users;
+$$;
+
+-- Количество рефералов: всего и активных (подписан хотя бы на одного спонсора)
+create or replace function get_referral_counts(p_user_id bigint)
+returns table (total integer, active integer)
+language sql stable as $$
+    select count(*)::int,
+           (count(*) filter (
+               where exists (
+                   select 1
+                     from user_sponsors us
+                     join sponsors s on s.id = us.sponsor_id
+                    where us.user_id = u.user_id
+                      and us.is_subscribed
+               )
+           ))::int
+      from users u
+     where u.referrer_id = p_user_id;
+$$;
+
+-- Статистика для админ панели одной строкой
+create or replace function get_admin_stats()
+returns table (
+    total_users bigint,
+    total_balance double precision,
+    total_wagered double precision,
+    pending_withdrawals bigint
+)
+language sql stable as $$
+    select count(*),
+           coalesce(sum(balance), 0),
+           coalesce(sum(total_wagered), 0),
+           (select count(*) from withdrawals where status = 'pending')
+      from users;
+$$;
+
+-- Атомарное изменение баланса, возвращает обновленную строку пользователя
+drop function if exists increment_balance(bigint, double precision);
+create or replace function increment_balance(
+    p_user_id bigint,
+    p_delta double precision
+) returns setof users
+language sql as $$
+    update users
+       set balance = balance + p_delta
+     where user_id = p_user_id
+    returning *;
+$$;
+
+-- Атомарное обновление статистики игр, возвращает обновленную строку пользователя
+drop function if exists increment_game_stats(bigint, double precision, boolean);
+create or replace function increment_game_stats(
+    p_user_id bigint,
+    p_wagered double precision,
+    p_won boolean
+) returns setof users
+language sql as $$
+    update users
+       set total_wagered = total_wagered + p_wagered,
+           games_played = games_played + 1,
+           games_won = games_won + p_won::int
+     where user_id = p_user_id
+    returning *;
+$$;
+
+-- Вывод средств: списание (если хватает баланса), заявка и транзакция.
+-- Возвращает ID заявки или null
+create or replace function create_withdrawal(
+    p_user_id bigint,
+    p_amount double precision,
+    p_ts bigint
+) returns bigint
+language plpgsql as $$
+declare
+    withdrawal_id bigint;
+begin
+    update users
+       set balance = balance - p_amount
+     where user_id = p_user_id
+       and balance >= p_amount;
+
+    if not found then
+        return null;
+    end if;
+
+    insert into withdrawals (user_id, amount, status, created_at)
+    values (p_user_id, p_amount, 'pending', p_ts)
+    returning id into withdrawal_id;
+
+    insert into transactions (user_id, amount, type, description, created_at)
+    values (p_user_id, -p_amount, 'withdrawal', 'Вывод #' || withdrawal_id, p_ts);
+
+    return withdrawal_id;
+end;
+$$;
+
+-- Счетчики рефералов хранятся в users и пересчитываются триггерами
+alter table users add column if not exists total_referrals integer not null default 0;
+alter table users add column if not exists active_referrals integer not null default 0;
+
+-- Пересчет счетчиков ищет рефералов по referrer_id (триггеры на горячих путях записи)
+create index if not exists users_referrer_id_idx on users (referrer_id);
+
+create or replace function refresh_referral_counts(p_user_id bigint)
+returns void
+language sql as $$
+    update users u
+       set total_referrals = c.total,
+           active_referrals = c.active
+      from get_referral_counts(p_user_id) c
+     where u.user_id = p_user_id;
+$$;
+
+-- Новый или переназначенный реферал
+create or replace function users_referral_trigger()
+returns trigger
+language plpgsql as $$
+begin
+    if tg_op = 'UPDATE' and old.referrer_id is not distinct from new.referrer_id then
+        return null;
+    end if;
+    if new.referrer_id is not null then
+        perform refresh_referral_counts(new.referrer_id);
+    end if;
+    if tg_op = 'UPDATE' and old.referrer_id is not null then
+        perform refresh_referral_counts(old.referrer_id);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists users_referral_counts on users;
+create trigger users_referral_counts
+after insert or update of referrer_id on users
+for each row execute function users_referral_trigger();
+
+-- Изменение подписки реферала
+create or replace function user_sponsors_referral_trigger()
+returns trigger
+language plpgsql as $$
+declare
+    v_referrer_id bigint;
+begin
+    select referrer_id into v_referrer_id
+      from users
+     where user_id = coalesce(new.user_id, old.user_id);
+
+    if v_referrer_id is not null then
+        perform refresh_referral_counts(v_referrer_id);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists user_sponsors_referral_counts on user_sponsors;
+create trigger user_sponsors_referral_counts
+after insert or update of is_subscribed or delete on user_sponsors
+for each row execute function user_sponsors_referral_trigger();
+
+-- Начальное заполнение счетчиков
+update users u
+   set total_referrals = c.total,
+       active_referrals = c.active
+  from users r
+ cross join lateral get_referral_counts(r.user_id) c
+ where u.user_id = r.user_id;
@@ -2,6 +2,12 @@ import random
 from typing import Dict, Any, Tuple
 from config import Config
 
+# Символы слот-машины
+_SLOT_SYMBOLS = ('🍌', '🐵', '⭐', '💎', '🎯', '💰', '🎰', '🍀')
+
+# Собственный генератор модуля (засевается из os.urandom)
+_rand = random.Random()
+
 class GameEngine:
     @staticmethod
     def play_flip(bet: float, choice: str) -> Tuple[bool, float, str]:
@@ -9,11 +15,11 @@ class GameEngine:
         game_config = Config.GAMES['flip']
         
         # Специальное событие (1.5% шанс проигрыша)
-        if random.random() < game_config['special_event_chance']:
+        if _rand.random() < game_config['special_event_chance']:
             return False, 0.0, "🍌🌀 Специальное событие! Банан улетел в космос!"
         
         # Основная логика
-        win = random.random() < game_config['win_chance']
+        win = _rand.random() < game_config['win_chance']
         
         if win:
             win_amount = bet * game_config['multiplier']
@@ -33,20 +39,20 @@ class GameEngine:
         game_config = Config.GAMES['crash']
         
         # 60% шанс мгновенного краша
-        if random.random() < game_config['instant_crash_chance']:
+        if _rand.random() < game_config['instant_crash_chance']:
             return False, 0.0, "💥 Мгновенный краш! x1.00"
         
         # 2% шанс на высокий множитель
-        if random.random() < game_config['high_multiplier_chance']:
-            multiplier = random.uniform(game_config['min_high_multiplier'], 5.0)
+        if _rand.random() < game_config['high_multiplier_chance']:
+            multiplier = _rand.uniform(game_config['min_high_multiplier'], 5.0)
             win_amount = bet * multiplier
             return True, win_amount, f"🚀 Улетный множитель! x{multiplier:.2f}"
         
         # Обычный низкий множитель
-        multiplier = random.uniform(*game_config['low_multiplier_range'])
+        multiplier = _rand.uniform(*game_config['low_multiplier_range'])
         
         # Игрок забирает в 80% случаев, когда множитель > 1.0
-        if multiplier > 1.0 and random.random() < 0.8:
+        if multiplier > 1.0 and _rand.random() < 0.8:
             win_amount = bet * multiplier
             return True, win_amount, f"✅ Вы забрали на x{multiplier:.2f}"
         else:
@@ -58,12 +64,7 @@ class GameEngine:
         game_config = Config.GAMES['slot']
         
         # Генерируем 3 барабана
-        symbols = ['🍌', '🐵', '⭐', '💎', '🎯', '💰', '🎰', '🍀']
-        reels = [
-            random.choice(symbols),
-            random.choice(symbols),
-            random.choice(symbols)
-        ]
+        reels = _rand.choices(_SLOT_SYMBOLS, k=3)
         
         # Проверяем выигрышную комбинацию (3 одинаковых символа)
         if reels[0] == reels[1] == reels[2]:
@@ -85,7 +86,7 @@ class GameEngine:
         game_config = Config.GAMES['dice']
         
         # Бросаем кубик (1-6)
-        dice_roll = random.randint(1, 6)
+        dice_roll = _rand.randint(1, 6)
         
         # Игрок выигрывает, если угадал число
         if user_number == dice_roll:
@@ -102,10 +103,29 @@ class GameEngine:
         game_config = Config.GAMES['jackpot']
         
         # 1% шанс выигрыша джекпота
-        if random.random() < game_config['win_chance']:
+        if _rand.random() < game_config['win_chance']:
             win_amount = bet * game_config['multiplier']
             result_text = f"💰 ДЖЕКПОТ!!! Вы выиграли {win_amount:.2f} STAR!"
             return True, win_amount, result_text
         else:
             result_text = f"💰 Билет не выиграл. Попробуйте еще!"
             return False, 0.0, result_text
+    
+    @staticmethod
+    def play_jackpot_batch(tickets: int, bet_per_ticket: float) -> Tuple[int, float]:
+        """Джекпот для пачки билетов: число выигравших билетов и сумма выигрыша"""
+        game_config = Config.GAMES['jackpot']
+        p = game_config['win_chance']
+        
+        # Число выигравших билетов ~ Binomial(tickets, p):
+        # один бросок и обратная функция распределения вместо броска на каждый билет
+        u = _rand.random()
+        prob = (1 - p) ** tickets
+        cdf = prob
+        wins = 0
+        while u > cdf and wins < tickets:
+            wins += 1
+            prob *= (tickets - wins + 1) / wins * p / (1 - p)
+            cdf += prob
+        
+        return wins, wins * bet_per_ticket * game_config['multiplier']
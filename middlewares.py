@@ -0,0 +1,96 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import CallbackQuery, TelegramObject
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
+
+# Пользователи, уже прочитанные при обработке текущего апдейта: user_id -> строка users
+request_users: ContextVar[Optional[Dict[int, Optional[Dict]]]] = ContextVar("request_users", default=None)
+
+class RequestCacheMiddleware(BaseMiddleware):
+    """Кэш пользователей на время обработки одного апдейта"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        token = request_users.set({})
+        try:
+            return await handler(event, data)
+        finally:
+            request_users.reset(token)
+
+class DedupMiddleware(BaseMiddleware):
+    """Пропуск нажатий, пока предыдущее нажатие пользователя еще обрабатывается"""
+
+    def __init__(self) -> None:
+        self._inflight: Set[int] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        user_id = event.from_user.id
+        if user_id in self._inflight:
+            await event.answer("⏳")
+            return None
+
+        self._inflight.add(user_id)
+        try:
+            return await handler(event, data)
+        finally:
+            self._inflight.discard(user_id)
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Ограничение частоты отправки и правки сообщений с повтором после 429"""
+
+    def __init__(self, rate: float, chat_rate: float, max_chats: int = 10_000) -> None:
+        self._limiter = AsyncLimiter(rate, 1)
+        self._chat_rate = chat_rate
+        self._chat_limiters: TTLCache = TTLCache(maxsize=max_chats, ttl=60)
+
+    def _chat_limiter(self, chat_id: Any) -> AsyncLimiter:
+        limiter = self._chat_limiters.get(chat_id)
+        if limiter is None:
+            limiter = AsyncLimiter(self._chat_rate, 1)
+        # Повторная запись продлевает ttl активного чата
+        self._chat_limiters[chat_id] = limiter
+        return limiter
+
+    async def _throttle(self, method: TelegramMethod[Any]) -> None:
+        # Отправки (sendMessage, sendPhoto...) — лимит чата и общий лимит бота;
+        # правки (editMessage*) — только общий лимит, чтобы удаление и отправка
+        # подряд в одном чате не ждали; ответы на callback и удаления — без ожидания
+        api_method = method.__api_method__
+        if api_method.startswith("send"):
+            chat_id = getattr(method, "chat_id", None)
+            if chat_id is not None:
+                await self._chat_limiter(chat_id).acquire()
+        elif not api_method.startswith("editMessage"):
+            return
+        await self._limiter.acquire()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        await self._throttle(method)
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await self._throttle(method)
+            return await make_request(bot, method)
@@ -0,0 +1,40 @@
+from typing import Any, Dict, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import InlineKeyboardMarkup, InputFile
+from aiohttp import FormData
+
+class PreserializedSession(AiohttpSession):
+    """AiohttpSession, отправляющий статичные клавиатуры заранее сериализованным JSON"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # id(клавиатуры) -> (клавиатура, JSON); ссылка на объект держит id неизменным
+        self._frozen: Dict[int, Tuple[InlineKeyboardMarkup, str]] = {}
+
+    def freeze(self, markup: InlineKeyboardMarkup) -> InlineKeyboardMarkup:
+        # Клавиатура после этого не должна изменяться
+        data = self.prepare_value(markup.model_dump(warnings=False), bot=None, files={})
+        self._frozen[id(markup)] = (markup, data)
+        return markup
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod[Any]) -> FormData:
+        markup = getattr(method, "reply_markup", None)
+        frozen = self._frozen.get(id(markup)) if markup is not None else None
+        if frozen is None or frozen[0] is not markup:
+            return super().build_form_data(bot, method)
+
+        # То же, что в AiohttpSession, но без повторной сериализации reply_markup
+        form = FormData(quote_fields=False)
+        files: Dict[str, InputFile] = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if not value:
+                continue
+            form.add_field(key, value)
+        form.add_field("reply_markup", frozen[1])
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
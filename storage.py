@@ -0,0 +1,32 @@
+from typing import Any, Dict
+
+from aiogram.fsm.storage.base import StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, MemoryStorageRecord
+from cachetools import TTLCache
+
+class _RecordCache(TTLCache):
+    """TTLCache, создающий пустую запись при обращении (как defaultdict)"""
+
+    def __missing__(self, key: StorageKey) -> MemoryStorageRecord:
+        record = MemoryStorageRecord()
+        self[key] = record
+        return record
+
+class TTLMemoryStorage(MemoryStorage):
+    """MemoryStorage с ограниченным размером и временем жизни состояний"""
+
+    def __init__(self, maxsize: int = 10_000, ttl: int = 600) -> None:
+        super().__init__()
+        self.storage = _RecordCache(maxsize=maxsize, ttl=ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await super().set_state(key, state)
+        self._touch(key)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await super().set_data(key, data)
+        self._touch(key)
+
+    def _touch(self, key: StorageKey) -> None:
+        # Брошенные сценарии (например, ввод ставки) удаляются через ttl после последней записи
+        self.storage[key] = self.storage[key]
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import sys
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("postgrest")
+pytest.importorskip("aiolimiter")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+
+import bot as bot_module  # noqa: E402
+from aiogram.methods import AnswerCallbackQuery, DeleteMessage, EditMessageText, SendMessage  # noqa: E402
+from aiogram.types import CallbackQuery, Chat, Message, Update, User  # noqa: E402
+
+USER_ID = 42
+
+def _callback_update(data: str) -> Update:
+    user = User(id=USER_ID, is_bot=False, first_name="Test")
+    message = Message(
+        message_id=7,
+        date=datetime.now(),
+        chat=Chat(id=USER_ID, type="private"),
+        text="menu"
+    )
+    return Update(
+        update_id=1,
+        callback_query=CallbackQuery(
+            id="cb1",
+            from_user=user,
+            chat_instance="ci",
+            data=data,
+            message=message
+        )
+    )
+
+def _feed(monkeypatch, update: Update) -> list:
+    """Прогнать апдейт через диспетчер, перехватив запросы к Telegram API"""
+    calls = []
+
+    async def make_request(bot, method, timeout=None):
+        calls.append(method)
+        return True
+
+    monkeypatch.setattr(bot_module.bot.session, "make_request", make_request)
+    asyncio.run(bot_module.dp.feed_update(bot_module.bot, update))
+    return calls
+
+def test_check_subscriptions_marks_sponsors_and_opens_menu(monkeypatch):
+    mark = AsyncMock(return_value=True)
+    monkeypatch.setattr(bot_module.db, "mark_all_sponsors_subscribed", mark)
+    monkeypatch.setattr(bot_module.db, "get_user", AsyncMock(return_value=None))
+
+    calls = _feed(monkeypatch, _callback_update("check_subscriptions"))
+
+    mark.assert_awaited_once_with(USER_ID)
+    sent = [type(method) for method in calls]
+    assert AnswerCallbackQuery in sent
+    assert DeleteMessage in sent
+    assert SendMessage in sent
+
+def test_click_edits_message_and_answers_callback(monkeypatch):
+    user = {"user_id": USER_ID, "balance": 1.0, "last_click": None, "referrer_id": None}
+    monkeypatch.setattr(bot_module.db, "user_is_fully_subscribed", AsyncMock(return_value=True))
+    monkeypatch.setattr(bot_module.db, "get_user", AsyncMock(return_value=user))
+    monkeypatch.setattr(bot_module.db, "record_click", AsyncMock(return_value=1.2))
+
+    calls = _feed(monkeypatch, _callback_update("click"))
+
+    sent = [type(method) for method in calls]
+    assert EditMessageText in sent
+    assert AnswerCallbackQuery in sent